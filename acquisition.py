@@ -0,0 +1,65 @@
+"""
+Continuous ADS1115 acquisition.
+
+The ADC runs in continuous conversion mode with ALERT/RDY as a conversion
+ready output. Every falling edge on that pin reads the conversion register
+and stores the raw count in a preallocated ring buffer, so readers never
+wait on the I2C bus. An optional filter stage (see filters.py) is fed from
+the interrupt as well.
+"""
+
+from array import array
+from machine import Pin
+import micropython
+
+micropython.alloc_emergency_exception_buf(100)
+
+
+class SampleRing:
+    def __init__(self, adc, pin, size=128, rate=4, channel1=0, channel2=None,
+                 filter=None):
+        # size must be a power of two
+        self.adc = adc
+        self.pin = pin
+        self.rate = rate
+        self.channel1 = channel1
+        self.channel2 = channel2
+        self.filter = filter
+        self.buf = array('h', bytes(2 * size))
+        self.mask = size - 1
+        self.head = 0
+        self.count = 0
+        # Readings so far, wraps before leaving the small int range
+        self.seq = 0
+        # Bound methods allocate when created, do it once here and not in
+        # the interrupt
+        self._handler = self._on_ready
+
+    def start(self):
+        self.head = 0
+        self.count = 0
+        if self.filter is not None:
+            self.filter.reset()
+        self.adc.conversion_start(self.rate, self.channel1, self.channel2)
+        self.pin.irq(trigger=Pin.IRQ_FALLING, handler=self._handler)
+
+    def stop(self):
+        self.pin.irq(handler=None)
+
+    def _on_ready(self, pin):
+        # No allocation here: alert_read uses the driver's buffer and
+        # returns a small int
+        x = self.adc.alert_read()
+        self.buf[self.head] = x
+        self.head = (self.head + 1) & self.mask
+        if self.count <= self.mask:
+            self.count += 1
+        self.seq = (self.seq + 1) & 0x3FFFFFFF
+        if self.filter is not None:
+            self.filter.push(x)
+
+    def latest(self):
+        """Last raw reading, None if nothing was converted yet."""
+        if not self.count:
+            return None
+        return self.buf[(self.head - 1) & self.mask]
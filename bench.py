@@ -0,0 +1,693 @@
+"""
+Benchmarks, runs on the host (python bench.py) or on the board
+(mpremote run bench.py).
+
+The firmware benchmarks need the host simulation (sim.py): they run
+main.py against the fake ADS1115, Nextion and oven for each cycle. Their
+results are checked against LIMITS, and the check_* functions test the
+protocol, filter and log logic. The exit status is non-zero if anything
+failed, so run it before flashing a board.
+
+On the board the checks and the conversion and log benchmarks run, their
+files go to /bench* directories on flash that are removed at the end.
+"""
+
+try:
+    from utime import ticks_us, ticks_diff
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+try:
+    import asyncio
+except ImportError:
+    import uasyncio as asyncio
+
+try:
+    import tempfile
+except ImportError:
+    tempfile = None
+
+import thermocouple
+
+# Worst acceptable firmware results, per cycle
+LIMITS = {
+    "touch response ms": 50,
+    "graph drawn ms": 500,
+    "i2c transactions/reading": 1.05,
+    "uart bytes/update": 64,
+    "control jitter max ms": 20,
+    "control overruns": 0,
+    "heater duty, stale input": 0,
+}
+
+# Scanner samples/s in simulated time, fraction of one reading per chip and
+# tick. The late ticks cost about 0.02, a scanner that waits an extra tick
+# on each read gets 0.5
+SCANNER_MIN = 0.95
+# And fraction of 860 SPS per chip. A conversion is given 1.1 times its
+# nominal time and the tick adds the 180 us of bus time of a read, 0.80 at
+# most, a longer tick period (e.g. a wider margin) falls below
+SCANNER_CHIP_MIN = 0.75
+
+failures = []
+# Directories made on flash by _scratch()
+_scratch_dirs = []
+
+
+def check(name, value, limit):
+    if value > limit:
+        failures.append("{} {:.2f} > {}".format(name, value, limit))
+
+
+def check_min(name, value, limit):
+    if value < limit:
+        failures.append("{} {:.2f} < {}".format(name, value, limit))
+
+
+def _remove(path):
+    import os
+    try:
+        for name in os.listdir(path):
+            os.remove(path + "/" + name)
+        os.rmdir(path)
+    except OSError:
+        pass
+
+
+def _scratch():
+    """New empty directory for the files of a check."""
+    if tempfile is not None:
+        return tempfile.mkdtemp()
+    import os
+    path = "/bench{}".format(len(_scratch_dirs))
+    _remove(path)
+    os.mkdir(path)
+    _scratch_dirs.append(path)
+    return path
+
+
+class _Uart:
+    def __init__(self):
+        self.out = bytearray()
+
+    def write(self, data):
+        self.out.extend(data)
+
+
+def check_nextion():
+    import nextion
+    display = nextion.Nextion(_Uart())
+    touched = []
+    touch = b'e\x00\x01\x01\xff\xff\xff'
+    display.on(touch, lambda f: touched.append(bytes(f)))
+    # A numeric reply of -1 is all 0xFF, the frame is only complete after
+    # its 4 payload bytes
+    p = [nextion._GET_CODES, asyncio.Event(), None]
+    display.pending.append(p)
+    frames = b'\x71\xff\xff\xff\xff\xff\xff\xff' + touch
+    for i in range(len(frames)):
+        # One byte at a time, as read from the UART
+        display.feed(frames[i:i + 1])
+    assert p[2] == -1, p[2]
+    assert touched == [touch], touched
+    # A failing handler does not stop the reader
+    display.on(touch, lambda f: 1 / 0)
+    display.feed(touch)
+    display.on(touch, lambda f: touched.append(bytes(f)))
+    display.feed(touch)
+    assert len(touched) == 2, touched
+    p = [nextion._GET_CODES, asyncio.Event(), None]
+    display.pending.append(p)
+    display.feed(b'\x70abc\xff\xff\xff')
+    assert p[2] == "abc", p[2]
+    assert not display.pending
+    # Success replies (bkcmd 1 or 3) do not answer a get
+    p = [nextion._GET_CODES, asyncio.Event(), None]
+    display.pending.append(p)
+    display.feed(b'\x01\xff\xff\xff')
+    assert display.pending == [p]
+    display.pending.clear()
+
+    # Commands are held during a transfer, a get is only sent after it
+    uart = display.uart
+    display.held = bytearray()
+    display.send("cle 1,0")
+    assert not uart.out and display.held == b'cle 1,0\xff\xff\xff'
+
+    async def held_get():
+        get = asyncio.create_task(display.get("n0.val", timeout_ms=50))
+        # Longer than the timeout
+        await asyncio.sleep(0.1)
+        assert not uart.out and not display.pending
+        display.held = None
+        await asyncio.sleep(0.03)
+        assert uart.out == b'get n0.val\xff\xff\xff', uart.out
+        display.feed(b'\x71\x05\x00\x00\x00\xff\xff\xff')
+        return await get
+    assert asyncio.run(held_get()) == 5
+    print("nextion framing ok")
+
+
+def check_widgets():
+    import nextion
+    uart = _Uart()
+    w = nextion.Widgets(nextion.Nextion(uart))
+    w.text("t0", 20, '{} C')
+    w.text("t0", 21, '{} C')
+    w.val("j0", 5)
+    w.flush()
+    assert uart.out == b't0.txt="21 C"\xff\xff\xffj0.val=5\xff\xff\xff', uart.out
+    assert (w.sent, w.suppressed) == (2, 1), (w.sent, w.suppressed)
+    w.text("t0", 21, '{} C')
+    w.val("j0", 5)
+    w.flush()
+    assert (w.sent, w.suppressed) == (2, 3), (w.sent, w.suppressed)
+    # An error reply makes the last flush be written again
+    w.display.feed(b'\x1a\xff\xff\xff')
+    w.val("j0", 5)
+    w.flush()
+    assert (w.sent, w.errors) == (3, 1), (w.sent, w.errors)
+    # Success replies are not errors
+    w.display.feed(b'\x01\xff\xff\xff')
+    w.val("j0", 5)
+    w.flush()
+    assert (w.sent, w.errors) == (3, 1), (w.sent, w.errors)
+    print("widgets ok")
+
+
+def check_filters():
+    import filters
+    m = filters.SlidingMedian(5)
+    out = [m.push(x) for x in (10, 10, 500, 10, 10, 12, -300, 12, 12)]
+    assert 500 not in out and -300 not in out, out
+    e = filters.Ema(2)
+    for i in range(100):
+        e.push(1000)
+    assert abs(e.value() - 1000) < 1, e.value()
+    d = filters.Decimator(4)
+    assert [d.push(x) for x in (1, 2, 3, 6)] == [None, None, None, 3]
+    p = filters.Pipeline(filters.SlidingMedian(3), filters.Decimator(2))
+    assert [p.push(x) for x in (4, 4, 900, 4)] == [None, 4, None, 4]
+    assert p.value() == 4
+    print("filters ok")
+
+
+def check_log():
+    import io
+    import tlog
+    log = tlog.Logger(_scratch())
+    log.start_run()
+    rows = [(i * 5000, -i, 20.0 + i / 10, None if i % 7 else 60, i % 256)
+            for i in range(2 * tlog.BUFFER_RECORDS + 3)]
+    for r in rows:
+        log.record(*r)
+        log.flush()
+    log.close()
+    out = io.StringIO()
+    tlog.export(log.path, out=out)
+    # What the export looks like once through the REPL console
+    text = _console(out.getvalue().encode())
+    decoded = [r[1:] for r in tlog.decode(tlog.unpack(text))]
+    assert len(decoded) == len(rows), len(decoded)
+    for r, d in zip(rows, decoded):
+        assert d[:2] == r[:2] and d[3:] == r[3:], (r, d)
+        assert abs(d[2] - r[2]) < 0.051, (r, d)
+    # Raw frames do not survive it
+    slot = tlog.segments(log.path)[-1][2]
+    with open(tlog._segment(log.path, slot), "rb") as f:
+        seg = f.read()
+    assert len(list(tlog.decode(_console(seg).encode()))) < len(rows)
+    # A segment file copied as it is
+    assert len(list(tlog.decode(seg))) == len(rows)
+
+    # Filesystem errors disable the log, they do not raise
+    # A file where the log directory should be
+    bad = tlog.Logger(tlog._segment(log.path, slot))
+    assert not bad.start_run() and bad.errors == 1
+    bad.record(0, 0, 20.0, 60, 0)
+    log.start_run()
+
+    class Full:
+        def write(self, data):
+            raise OSError(28)  # ENOSPC
+
+        def close(self):
+            pass
+    log.f = Full()
+    for r in rows:
+        log.record(*r)
+        log.flush()
+    assert not log.enabled and log.errors == 1, (log.enabled, log.errors)
+    log.close()
+    # Failing on the last batch when the next run starts
+    log.start_run()
+    log.f = Full()
+    for r in rows[:tlog.BUFFER_RECORDS]:
+        log.record(*r)
+    assert log.start_run() and log.errors == 2, (log.enabled, log.errors)
+
+    # The writer does not wait for a full batch for ever
+    for r in rows[:3]:
+        log.record(*r)
+
+    async def writer():
+        task = asyncio.create_task(log.run_writer(period_ms=10, max_age_ms=50))
+        await asyncio.sleep(0.2)
+        task.cancel()
+    asyncio.run(writer())
+    slot = tlog.segments(log.path)[-1][2]
+    with open(tlog._segment(log.path, slot), "rb") as f:
+        assert len(list(tlog.decode(f.read()))) == 3
+    log.close()
+    print("log round trip ok")
+
+
+def _console(data):
+    """Bytes printed on the board as received by mpremote exec: the board
+       sends 0x0A as 0x0D 0x0A, mpremote stops at the first 0x04 (end of
+       the output), drops 0x04 bytes and decodes UTF-8."""
+    data = data.replace(b"\n", b"\r\n")
+    end = data.find(b"\x04")
+    if end >= 0:
+        data = data[:end]
+    return data.replace(b"\x04", b"").decode("utf-8", "replace")
+
+
+# The table main.py had, type K from 0 to 99.9 C every 0.1 C
+LEGACY_MV = (
+    0.000000, 0.003945, 0.007891, 0.011837, 0.015784, 0.019731, 0.023679, 0.027627,
+    0.031576, 0.035525, 0.039474, 0.043425, 0.047375, 0.051326, 0.055278, 0.059230,
+    0.063182, 0.067135, 0.071089, 0.075043, 0.078997, 0.082952, 0.086908, 0.090863,
+    0.094820, 0.098777, 0.102734, 0.106692, 0.110650, 0.114609, 0.118568, 0.122528,
+    0.126488, 0.130448, 0.134410, 0.138371, 0.142333, 0.146296, 0.150259, 0.154222,
+    0.158186, 0.162150, 0.166115, 0.170081, 0.174046, 0.178013, 0.181979, 0.185947,
+    0.189914, 0.193882, 0.197851, 0.201820, 0.205790, 0.209760, 0.213730, 0.217701,
+    0.221672, 0.225644, 0.229616, 0.233589, 0.237562, 0.241536, 0.245510, 0.249485,
+    0.253460, 0.257435, 0.261411, 0.265388, 0.269364, 0.273342, 0.277320, 0.281298,
+    0.285276, 0.289256, 0.293235, 0.297215, 0.301196, 0.305177, 0.309158, 0.313140,
+    0.317122, 0.321105, 0.325088, 0.329072, 0.333056, 0.337040, 0.341025, 0.345011,
+    0.348997, 0.352983, 0.356970, 0.360957, 0.364945, 0.368933, 0.372921, 0.376910,
+    0.380900, 0.384890, 0.388880, 0.392871, 0.396862, 0.400854, 0.404846, 0.408838,
+    0.412831, 0.416824, 0.420818, 0.424813, 0.428807, 0.432802, 0.436798, 0.440794,
+    0.444790, 0.448787, 0.452785, 0.456782, 0.460780, 0.464779, 0.468778, 0.472778,
+    0.476777, 0.480778, 0.484779, 0.488780, 0.492781, 0.496783, 0.500786, 0.504789,
+    0.508792, 0.512796, 0.516800, 0.520805, 0.524810, 0.528815, 0.532821, 0.536827,
+    0.540834, 0.544841, 0.548849, 0.552857, 0.556865, 0.560874, 0.564883, 0.568893,
+    0.572903, 0.576913, 0.580924, 0.584935, 0.588947, 0.592959, 0.596972, 0.600985,
+    0.604998, 0.609012, 0.613026, 0.617041, 0.621056, 0.625072, 0.629087, 0.633104,
+    0.637120, 0.641138, 0.645155, 0.649173, 0.653191, 0.657210, 0.661229, 0.665249,
+    0.669269, 0.673289, 0.677310, 0.681331, 0.685353, 0.689375, 0.693397, 0.697420,
+    0.701443, 0.705467, 0.709491, 0.713515, 0.717540, 0.721565, 0.725591, 0.729617,
+    0.733643, 0.737670, 0.741697, 0.745725, 0.749753, 0.753781, 0.757810, 0.761839,
+    0.765869, 0.769899, 0.773929, 0.777960, 0.781991, 0.786023, 0.790055, 0.794087,
+    0.798120, 0.802153, 0.806186, 0.810220, 0.814254, 0.818289, 0.822324, 0.826360,
+    0.830395, 0.834432, 0.838468, 0.842505, 0.846543, 0.850580, 0.854619, 0.858657,
+    0.862696, 0.866735, 0.870775, 0.874815, 0.878855, 0.882896, 0.886937, 0.890979,
+    0.895021, 0.899063, 0.903106, 0.907149, 0.911192, 0.915236, 0.919280, 0.923325,
+    0.927370, 0.931415, 0.935461, 0.939507, 0.943553, 0.947600, 0.951647, 0.955695,
+    0.959743, 0.963791, 0.967840, 0.971889, 0.975938, 0.979988, 0.984038, 0.988089,
+    0.992140, 0.996191, 1.000242, 1.004294, 1.008347, 1.012399, 1.016452, 1.020506,
+    1.024560, 1.028614, 1.032668, 1.036723, 1.040778, 1.044834, 1.048890, 1.052946,
+    1.057003, 1.061060, 1.065117, 1.069175, 1.073233, 1.077291, 1.081350, 1.085409,
+    1.089468, 1.093528, 1.097588, 1.101649, 1.105710, 1.109771, 1.113833, 1.117895,
+    1.121957, 1.126020, 1.130083, 1.134146, 1.138209, 1.142273, 1.146338, 1.150403,
+    1.154468, 1.158533, 1.162599, 1.166665, 1.170731, 1.174798, 1.178865, 1.182932,
+    1.187000, 1.191068, 1.195137, 1.199206, 1.203275, 1.207344, 1.211414, 1.215484,
+    1.219555, 1.223625, 1.227697, 1.231768, 1.235840, 1.239912, 1.243984, 1.248057,
+    1.252130, 1.256204, 1.260278, 1.264352, 1.268426, 1.272501, 1.276576, 1.280651,
+    1.284727, 1.288803, 1.292880, 1.296956, 1.301033, 1.305111, 1.309189, 1.313267,
+    1.317345, 1.321424, 1.325503, 1.329582, 1.333661, 1.337741, 1.341822, 1.345902,
+    1.349983, 1.354064, 1.358146, 1.362228, 1.366310, 1.370392, 1.374475, 1.378558,
+    1.382642, 1.386725, 1.390809, 1.394894, 1.398978, 1.403063, 1.407149, 1.411234,
+    1.415320, 1.419406, 1.423493, 1.427579, 1.431667, 1.435754, 1.439842, 1.443930,
+    1.448018, 1.452107, 1.456196, 1.460285, 1.464374, 1.468464, 1.472554, 1.476645,
+    1.480735, 1.484826, 1.488918, 1.493009, 1.497101, 1.501193, 1.505286, 1.509379,
+    1.513472, 1.517565, 1.521659, 1.525753, 1.529847, 1.533942, 1.538036, 1.542131,
+    1.546227, 1.550323, 1.554418, 1.558515, 1.562611, 1.566708, 1.570805, 1.574903,
+    1.579000, 1.583098, 1.587197, 1.591295, 1.595394, 1.599493, 1.603592, 1.607692,
+    1.611792, 1.615892, 1.619993, 1.624093, 1.628194, 1.632296, 1.636397, 1.640499,
+    1.644601, 1.648704, 1.652806, 1.656909, 1.661012, 1.665116, 1.669220, 1.673324,
+    1.677428, 1.681532, 1.685637, 1.689742, 1.693848, 1.697953, 1.702059, 1.706165,
+    1.710272, 1.714378, 1.718485, 1.722593, 1.726700, 1.730808, 1.734916, 1.739024,
+    1.743132, 1.747241, 1.751350, 1.755459, 1.759569, 1.763679, 1.767789, 1.771899,
+    1.776009, 1.780120, 1.784231, 1.788343, 1.792454, 1.796566, 1.800678, 1.804790,
+    1.808903, 1.813015, 1.817128, 1.821242, 1.825355, 1.829469, 1.833583, 1.837697,
+    1.841812, 1.845926, 1.850041, 1.854157, 1.858272, 1.862388, 1.866504, 1.870620,
+    1.874736, 1.878853, 1.882970, 1.887087, 1.891204, 1.895322, 1.899439, 1.903557,
+    1.907676, 1.911794, 1.915913, 1.920032, 1.924151, 1.928270, 1.932390, 1.936510,
+    1.940630, 1.944750, 1.948871, 1.952992, 1.957112, 1.961234, 1.965355, 1.969477,
+    1.973599, 1.977721, 1.981843, 1.985966, 1.990088, 1.994211, 1.998334, 2.002458,
+    2.006581, 2.010705, 2.014829, 2.018953, 2.023078, 2.027203, 2.031327, 2.035453,
+    2.039578, 2.043703, 2.047829, 2.051955, 2.056081, 2.060207, 2.064334, 2.068461,
+    2.072588, 2.076715, 2.080842, 2.084970, 2.089097, 2.093225, 2.097353, 2.101482,
+    2.105610, 2.109739, 2.113868, 2.117997, 2.122127, 2.126256, 2.130386, 2.134516,
+    2.138646, 2.142776, 2.146907, 2.151037, 2.155168, 2.159299, 2.163430, 2.167562,
+    2.171693, 2.175825, 2.179957, 2.184089, 2.188222, 2.192354, 2.196487, 2.200620,
+    2.204753, 2.208886, 2.213020, 2.217153, 2.221287, 2.225421, 2.229555, 2.233690,
+    2.237824, 2.241959, 2.246094, 2.250229, 2.254364, 2.258499, 2.262635, 2.266770,
+    2.270906, 2.275042, 2.279179, 2.283315, 2.287452, 2.291588, 2.295725, 2.299862,
+    2.303999, 2.308137, 2.312274, 2.316412, 2.320550, 2.324688, 2.328826, 2.332964,
+    2.337103, 2.341241, 2.345380, 2.349519, 2.353658, 2.357798, 2.361937, 2.366076,
+    2.370216, 2.374356, 2.378496, 2.382636, 2.386777, 2.390917, 2.395058, 2.399198,
+    2.403339, 2.407480, 2.411622, 2.415763, 2.419904, 2.424046, 2.428188, 2.432330,
+    2.436472, 2.440614, 2.444756, 2.448899, 2.453041, 2.457184, 2.461327, 2.465470,
+    2.469613, 2.473756, 2.477899, 2.482043, 2.486187, 2.490330, 2.494474, 2.498618,
+    2.502763, 2.506907, 2.511051, 2.515196, 2.519340, 2.523485, 2.527630, 2.531775,
+    2.535920, 2.540066, 2.544211, 2.548357, 2.552502, 2.556648, 2.560794, 2.564940,
+    2.569086, 2.573232, 2.577378, 2.581525, 2.585671, 2.589818, 2.593965, 2.598112,
+    2.602259, 2.606406, 2.610553, 2.614700, 2.618848, 2.622995, 2.627143, 2.631291,
+    2.635439, 2.639586, 2.643734, 2.647883, 2.652031, 2.656179, 2.660328, 2.664476,
+    2.668625, 2.672774, 2.676922, 2.681071, 2.685220, 2.689369, 2.693519, 2.697668,
+    2.701817, 2.705967, 2.710116, 2.714266, 2.718416, 2.722565, 2.726715, 2.730865,
+    2.735015, 2.739166, 2.743316, 2.747466, 2.751617, 2.755767, 2.759918, 2.764068,
+    2.768219, 2.772370, 2.776521, 2.780672, 2.784823, 2.788974, 2.793125, 2.797276,
+    2.801427, 2.805579, 2.809730, 2.813882, 2.818033, 2.822185, 2.826337, 2.830489,
+    2.834640, 2.838792, 2.842944, 2.847096, 2.851249, 2.855401, 2.859553, 2.863705,
+    2.867858, 2.872010, 2.876163, 2.880315, 2.884468, 2.888620, 2.892773, 2.896926,
+    2.901079, 2.905231, 2.909384, 2.913537, 2.917690, 2.921843, 2.925996, 2.930150,
+    2.934303, 2.938456, 2.942609, 2.946763, 2.950916, 2.955070, 2.959223, 2.963376,
+    2.967530, 2.971684, 2.975837, 2.979991, 2.984145, 2.988298, 2.992452, 2.996606,
+    3.000760, 3.004914, 3.009068, 3.013222, 3.017376, 3.021530, 3.025684, 3.029838,
+    3.033992, 3.038146, 3.042300, 3.046454, 3.050608, 3.054763, 3.058917, 3.063071,
+    3.067225, 3.071380, 3.075534, 3.079688, 3.083843, 3.087997, 3.092152, 3.096306,
+    3.100460, 3.104615, 3.108769, 3.112924, 3.117078, 3.121233, 3.125387, 3.129542,
+    3.133696, 3.137851, 3.142005, 3.146160, 3.150315, 3.154469, 3.158624, 3.162778,
+    3.166933, 3.171088, 3.175242, 3.179397, 3.183551, 3.187706, 3.191860, 3.196015,
+    3.200170, 3.204324, 3.208479, 3.212633, 3.216788, 3.220942, 3.225097, 3.229252,
+    3.233406, 3.237561, 3.241715, 3.245870, 3.250024, 3.254179, 3.258333, 3.262487,
+    3.266642, 3.270796, 3.274951, 3.279105, 3.283259, 3.287414, 3.291568, 3.295722,
+    3.299877, 3.304031, 3.308185, 3.312339, 3.316494, 3.320648, 3.324802, 3.328956,
+    3.333110, 3.337264, 3.341418, 3.345572, 3.349726, 3.353880, 3.358034, 3.362188,
+    3.366342, 3.370496, 3.374649, 3.378803, 3.382957, 3.387110, 3.391264, 3.395418,
+    3.399571, 3.403725, 3.407878, 3.412032, 3.416185, 3.420338, 3.424492, 3.428645,
+    3.432798, 3.436951, 3.441104, 3.445257, 3.449410, 3.453563, 3.457716, 3.461869,
+    3.466022, 3.470175, 3.474327, 3.478480, 3.482633, 3.486785, 3.490938, 3.495090,
+    3.499242, 3.503395, 3.507547, 3.511699, 3.515851, 3.520003, 3.524155, 3.528307,
+    3.532459, 3.536611, 3.540763, 3.544915, 3.549066, 3.553218, 3.557369, 3.561521,
+    3.565672, 3.569823, 3.573975, 3.578126, 3.582277, 3.586428, 3.590579, 3.594730,
+    3.598880, 3.603031, 3.607182, 3.611332, 3.615483, 3.619633, 3.623783, 3.627934,
+    3.632084, 3.636234, 3.640384, 3.644534, 3.648684, 3.652833, 3.656983, 3.661133,
+    3.665282, 3.669432, 3.673581, 3.677730, 3.681879, 3.686028, 3.690177, 3.694326,
+    3.698475, 3.702624, 3.706772, 3.710921, 3.715069, 3.719217, 3.723366, 3.727514,
+    3.731662, 3.735810, 3.739957, 3.744105, 3.748253, 3.752400, 3.756548, 3.760695,
+    3.764842, 3.768989, 3.773136, 3.777283, 3.781430, 3.785577, 3.789723, 3.793870,
+    3.798016, 3.802163, 3.806309, 3.810455, 3.814601, 3.818747, 3.822892, 3.827038,
+    3.831183, 3.835329, 3.839474, 3.843619, 3.847764, 3.851909, 3.856054, 3.860199,
+    3.864343, 3.868488, 3.872632, 3.876776, 3.880920, 3.885064, 3.889208, 3.893352,
+    3.897495, 3.901639, 3.905782, 3.909925, 3.914068, 3.918211, 3.922354, 3.926497,
+    3.930640, 3.934782, 3.938924, 3.943067, 3.947209, 3.951350, 3.955492, 3.959634,
+    3.963775, 3.967917, 3.972058, 3.976199, 3.980340, 3.984481, 3.988622, 3.992762,
+    3.996903, 4.001043, 4.005183, 4.009323, 4.013463, 4.017603, 4.021743, 4.025882,
+    4.030021, 4.034160, 4.038299, 4.042438, 4.046577, 4.050716, 4.054854, 4.058992,
+    4.063131, 4.067268, 4.071406, 4.075544, 4.079682, 4.083819, 4.087956, 4.092093,
+)
+
+
+# The conversion as it was in main.py: the list is rebuilt on every call
+# and scanned for the nearest point.
+def legacy_temp_from_voltage(v):
+    li_0_100_every_0_1 = list(LEGACY_MV)
+    closest = 0
+    for i in range(len(li_0_100_every_0_1)):
+        if abs(li_0_100_every_0_1[i]-v) < abs(li_0_100_every_0_1[closest]-v):
+            closest = i
+    return closest*0.1
+
+
+def timeit(f, args):
+    t0 = ticks_us()
+    for a in args:
+        f(a)
+    return ticks_diff(ticks_us(), t0) / len(args)
+
+
+def bench_conversion(n=200):
+    # Within the legacy table, it clamped at 99.9 C
+    inputs = [i * LEGACY_MV[-1] / n for i in range(n)]
+    worst = 0
+    for v in inputs:
+        worst = max(worst, abs(thermocouple.mv_to_c(v) - legacy_temp_from_voltage(v)))
+    # Nearest neighbour is at most half a step away from the interpolation
+    assert worst <= thermocouple.T_STEP / 2 + 1e-3, worst
+
+    print("conversion, max difference to legacy: {:.4f} C".format(worst))
+    print("  legacy scan   {:10.1f} us/call".format(timeit(legacy_temp_from_voltage, inputs)))
+    print("  table bisect  {:10.1f} us/call".format(timeit(thermocouple.mv_to_c, inputs)))
+    print("  its-90 poly   {:10.1f} us/call".format(timeit(thermocouple.mv_to_c_its90, inputs)))
+    t0 = ticks_us()
+    thermocouple.load(thermocouple._dir + thermocouple.TABLE_FILE)
+    print("  table load    {:10.1f} us, {} points".format(
+        ticks_diff(ticks_us(), t0), len(thermocouple.TABLE_MV)))
+
+    # A truncated or foreign file is refused, the loaded table stays
+    path = _scratch() + "/table.bin"
+    with open(thermocouple._dir + thermocouple.TABLE_FILE, "rb") as f:
+        data = f.read()
+    table = thermocouple.TABLE_MV
+    for bad in (data[:len(data) - 4], data[:10], b"TKTX" + data[4:]):
+        with open(path, "wb") as f:
+            f.write(bad)
+        try:
+            thermocouple.load(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("loaded a bad table of {} bytes".format(len(bad)))
+        assert thermocouple.TABLE_MV is table
+
+
+async def _loop_lag(lags, period_ms=1):
+    # How late the event loop wakes a task up
+    while True:
+        t0 = ticks_us()
+        await asyncio.sleep(period_ms / 1000)
+        lags.append(ticks_diff(ticks_us(), t0) - period_ms * 1000)
+
+
+async def _run_cycle(main, board, mode, seconds):
+    import prof
+    hw = asyncio.create_task(board.run())
+    fw = asyncio.create_task(main.main())
+    # Startup page changes
+    await asyncio.sleep(1.2)
+
+    port = board.uarts[1]
+    writes = len(port.tx_writes)
+    addt_done = len(board.nextion.addt_done)
+    touched = board.nextion.touch(mode)
+    while len(port.tx_writes) == writes or port.tx_writes[-1] < touched:
+        await asyncio.sleep(0.001)
+    response = port.tx_writes[-1] - touched
+    # A UI update landing during the transfer must not end up in the graph
+    while not board.nextion.transparent:
+        await asyncio.sleep(0.001)
+    main.widgets.val(main.UI.PROGRESS_BAR, 99)
+    main.widgets.flush()
+    while len(board.nextion.addt_done) == addt_done:
+        await asyncio.sleep(0.01)
+    graph = board.nextion.addt_done[-1] - touched
+    # Nothing else was written into the transparent transfer
+    expected = main.oven.cycle_graph_points(main.Oven.graph_width)
+    assert board.nextion.addt_data == expected, "graph data corrupted"
+    await asyncio.sleep(0.1)
+    assert board.nextion.values.get("j0.val") == 99, "update lost"
+
+    # Steady state
+    prof.reset()
+    updates = [0]
+    ui_update = main.Oven.ui_update
+
+    def counted(self, temp):
+        updates[0] += 1
+        ui_update(self, temp)
+    main.Oven.ui_update = counted
+    bus = board.buses[1]
+    i2c0 = bus.transactions
+    reads0 = board.ads.result_reads
+    tx0 = port.tx_bytes
+    lags = []
+    lag = asyncio.create_task(_loop_lag(lags))
+    await asyncio.sleep(seconds)
+    lag.cancel()
+    rate = main.control_rate
+    main.Oven.ui_update = ui_update
+    reads = board.ads.result_reads - reads0
+    res = {
+        "touch response ms": response * 1000,
+        "graph drawn ms": graph * 1000,
+        "loop lag mean ms": sum(lags) / len(lags) / 1000,
+        "loop lag max ms": max(lags) / 1000,
+        "readings/s": reads / seconds,
+        "i2c transactions/reading": (bus.transactions - i2c0) / max(reads, 1),
+        "uart bytes/update": (port.tx_bytes - tx0) / max(updates[0], 1),
+        "control jitter mean ms": rate.jitter_mean_ms(),
+        "control jitter max ms": rate.jitter_max_ms,
+        "control overruns": rate.overruns,
+        "oven temp C": board.oven.temp,
+        "heater duty": board.oven.heater,
+    }
+
+    # ALERT/RDY stops firing with a cold oven: the heater is cut within
+    # two control periods instead of following the last temperature
+    board.oven.temp = board.oven.ambient
+    await asyncio.sleep(0.5)
+    pin = board.ads.alert_pin
+    board.ads.alert_pin = None
+    await asyncio.sleep(2.5)
+    res["heater duty, stale input"] = board.oven.heater
+    board.ads.alert_pin = pin
+
+    fw.cancel()
+    hw.cancel()
+    main.logger.close()
+    return res
+
+
+def bench_firmware(seconds=3, profile=False):
+    """Run each cycle. LIMITS are checked on the build that ships, with
+       profile the timed methods are wrapped and the profile printed."""
+    import sys
+    import sim
+    board = sim.install()
+    board.oven.speed = 600
+    import prof
+    prof.enable(profile)
+    # prof.timed wraps when main is imported
+    sys.modules.pop("main", None)
+    import main
+    main.logger.path = tempfile.mkdtemp()
+
+    names = {main.UI.IB2_16H_24H: "IB2 16h/24h", main.UI.IB2_16H_16H: "IB2 16h/16h",
+             main.UI.UNIMOULD: "UNIMOULD"}
+    for mode in main.Oven.CYCLES:
+        res = asyncio.run(_run_cycle(main, board, mode, seconds))
+        print("firmware, {}{}".format(names.get(mode, mode),
+                                      " (profiled)" if profile else ""))
+        for k in res:
+            print("  {:26s}{:10.2f}".format(k, res[k]))
+            if k in LIMITS and not profile:
+                check(k, res[k], LIMITS[k])
+        if profile:
+            print("  profile", prof.stats_line())
+            prof.reset()
+    prof.enable(False)
+
+
+def _scan(board, clock, fakes, name, probes, seconds):
+    import scanner
+    scan = scanner.Scanner(probes)
+    bus = board.buses[1]
+    i2c0 = bus.transactions
+    early0 = sum(f.early_reads for f in fakes)
+    # Let the conversions of a previous scan end
+    clock.advance(0.01)
+    scan.start()
+    t0 = clock()
+    clock.advance(seconds)
+    scan.stop()
+    seconds = clock() - t0
+    samples = sum(scan.counts)
+
+    print("scanner, {} at 860 SPS".format(name))
+    limit = 860 * len(scan.chips)
+    print("  samples/s             {:10.1f}".format(samples / seconds))
+    print("  chip limit            {:10.1f}".format(limit))
+    print("  tick period us        {:10d}".format(1000000 // scan.freq))
+    print("  i2c us/read           {:10d}".format(scan.i2c_us))
+    print("  i2c transactions/sample {:8.2f}".format((bus.transactions - i2c0) / samples))
+    early = sum(f.early_reads for f in fakes) - early0
+    print("  reads before conversion end {:4d}".format(early))
+    print("  ticks                 {:10d}".format(scan.ticks))
+    print("  early ticks polled    {:10d}".format(scan.polls))
+    print("  ticks left for the next {:8d}".format(scan.skipped))
+    print("  temperatures          ", ["{:.1f}".format(t) for t in scan.temperatures()])
+    check_min(name + " samples/s", samples / seconds,
+              SCANNER_MIN * scan.samples_per_second())
+    check_min(name + " samples/s of the chip limit", samples / seconds,
+              SCANNER_CHIP_MIN * limit)
+    check(name + " early reads", early, 0)
+
+
+def bench_scanner(seconds=2):
+    import sim
+    board = sim.install()
+    fakes = [board.ads]
+    for address in (0x49, 0x4A):
+        f = board.buses[1].devices.get(address)
+        if f is None:
+            f = sim.FakeADS1115(board, bus=1, address=address)
+            f.inputs[(0, None)] = board.oven.thermocouple_v
+        fakes.append(f)
+    import main
+
+    i2c = main.I2C(id=1, scl=main.Pin(3), sda=main.Pin(2), freq=400000)
+    adcs = [main.ADS1115(i2c, address=a, gain=5) for a in (0x48, 0x49, 0x4A)]
+    # Simulated time, the results do not depend on the host: the I2C
+    # transfers take their bus time, 1 % of the ticks come 2 ms late and
+    # the ones missed meanwhile run right after
+    clock = sim.SimClock(board, late_every=100, late_s=0.002)
+    sim.use_clock(clock)
+    try:
+        # Two probes on the first chip, one on the second (continuous mode)
+        _scan(board, clock, fakes, "3 probes on 2 chips",
+              [(adcs[0], 0, None), (adcs[0], 1, None), (adcs[1], 0, None)],
+              seconds)
+        # Every chip switching between two probes
+        _scan(board, clock, fakes, "6 probes on 3 chips",
+              [(adc, channel, None) for adc in adcs for channel in (0, 1)],
+              seconds)
+    finally:
+        sim.use_clock(None)
+
+
+def bench_log(records=20000):
+    import io
+    import tlog
+
+    log = tlog.Logger(_scratch())
+    log.start_run()
+    t0 = ticks_us()
+    for i in range(records):
+        log.record(i * 1000, 1234, 60.0 + i % 10, 60, 6)
+        log.flush()
+    log.close()
+    write_us = ticks_diff(ticks_us(), t0)
+    out = io.StringIO()
+    t0 = ticks_us()
+    tlog.export(log.path, out=out)
+    export_us = ticks_diff(ticks_us(), t0)
+    decoded = list(tlog.decode(tlog.unpack(out.getvalue())))
+    assert len(decoded) == records, len(decoded)
+
+    print("log, {} records of {} bytes".format(records, tlog.RECORD_SIZE))
+    print("  record+flush  {:10.1f} us/record".format(write_us / records))
+    print("  export        {:10.1f} ms, {} bytes".format(export_us / 1000, len(out.getvalue())))
+
+
+if __name__ == "__main__":
+    import sys
+    host = sys.implementation.name != "micropython"
+    if host:
+        import sim
+        sim.install()
+    check_nextion()
+    check_widgets()
+    check_filters()
+    check_log()
+    bench_conversion()
+    bench_log()
+    if host:
+        bench_firmware()
+        bench_firmware(1, profile=True)
+        bench_scanner()
+    for path in _scratch_dirs:
+        _remove(path)
+    if failures:
+        print("FAILED:", ", ".join(failures))
+        sys.exit(1)
@@ -0,0 +1,105 @@
+"""
+Heater control.
+
+A PID runs at a fixed period (FixedRate), following the setpoints of an
+Oven.CYCLES schedule and driving the heater SSR with PWM. FixedRate keeps
+its deadlines with ticks_ms/ticks_diff and counts jitter and overruns so
+we know the loop keeps up under the I2C and UART load.
+"""
+
+import utime as time
+import uasyncio as asyncio
+from machine import PWM
+
+
+def setpoint(cycle, elapsed_s):
+    """Setpoint of a [(<duration in hour>, <temp in C>), ...] cycle after
+       elapsed_s seconds, None once the cycle is over."""
+    end = 0
+    for e in cycle:
+        end += e[0] * 3600
+        if elapsed_s < end:
+            return e[1]
+    return None
+
+
+class PID:
+    """PID on the measurement (no derivative kick on setpoint steps), the
+       integral only moves while the output is not saturated."""
+
+    def __init__(self, kp, ki, kd=0.0, out_min=0.0, out_max=1.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.out_min = out_min
+        self.out_max = out_max
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.last = None
+
+    def update(self, sp, measured, dt):
+        err = sp - measured
+        d = 0.0
+        if self.last is not None and dt > 0:
+            d = -(measured - self.last) / dt
+        self.last = measured
+        out = self.kp * err + self.integral + self.kd * d
+        i = self.integral + self.ki * err * dt
+        # Anti-windup
+        if self.out_min < self.kp * err + i + self.kd * d < self.out_max:
+            self.integral = i
+        return min(max(out, self.out_min), self.out_max)
+
+
+class PwmOutput:
+    """Heater SSR on a PWM pin. The RP2040 cannot go much under 8 Hz, with
+       a zero crossing SSR the duty is quantized to mains half cycles."""
+
+    def __init__(self, pin, freq=10):
+        self.pwm = PWM(pin)
+        self.pwm.freq(freq)
+        self.set(0.0)
+
+    def set(self, duty):
+        self.duty = duty
+        self.pwm.duty_u16(int(duty * 65535))
+
+    def off(self):
+        """Heater off and PWM stopped, for shutdown."""
+        self.set(0.0)
+        self.pwm.deinit()
+
+
+class FixedRate:
+    """Run a function every period_ms. Lateness of each run is the jitter,
+       an overrun is a run ending after the next deadline (missed
+       deadlines are skipped, not caught up)."""
+
+    def __init__(self, period_ms):
+        self.period_ms = period_ms
+        self.runs = 0
+        self.overruns = 0
+        self.jitter_max_ms = 0
+        self.jitter_sum_ms = 0
+
+    def jitter_mean_ms(self):
+        return self.jitter_sum_ms / self.runs if self.runs else 0
+
+    async def run(self, f):
+        deadline = time.ticks_ms()
+        while True:
+            deadline = time.ticks_add(deadline, self.period_ms)
+            delay = time.ticks_diff(deadline, time.ticks_ms())
+            await asyncio.sleep_ms(delay if delay > 0 else 0)
+            late = time.ticks_diff(time.ticks_ms(), deadline)
+            self.runs += 1
+            self.jitter_sum_ms += late
+            if late > self.jitter_max_ms:
+                self.jitter_max_ms = late
+            f()
+            if time.ticks_diff(time.ticks_ms(), deadline) >= self.period_ms:
+                self.overruns += 1
+                print("control overrun", self.overruns, "late", late, "ms")
+                deadline = time.ticks_ms()
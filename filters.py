@@ -0,0 +1,137 @@
+"""
+Streaming filters for raw ADC counts.
+
+Each stage takes one raw count per push() with constant work and a fixed
+memory footprint. State is kept in small ints so push() does not allocate
+and can run in the ALERT/RDY interrupt. value() gives the output in counts
+as a float.
+"""
+
+from array import array
+
+# Fixed point fraction bits of the EMA state
+_FRAC = const(8)
+
+
+class Ema:
+    """Exponential moving average, alpha = 1/2**shift."""
+
+    def __init__(self, shift=4):
+        self.shift = shift
+        self.y = None
+
+    def reset(self):
+        self.y = None
+
+    def push(self, x):
+        x <<= _FRAC
+        if self.y is None:
+            self.y = x
+        else:
+            self.y += (x - self.y) >> self.shift
+        return self.y >> _FRAC
+
+    def value(self):
+        if self.y is None:
+            return None
+        return self.y / (1 << _FRAC)
+
+
+class SlidingMedian:
+    """Median of the last size samples, rejects single spikes. The window
+       is kept sorted, a push moves at most size values."""
+
+    def __init__(self, size=5):
+        self.ring = array('h', bytes(2 * size))
+        self.sorted = array('h', bytes(2 * size))
+        self.size = size
+        self.head = 0
+        self.count = 0
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+
+    def push(self, x):
+        s = self.sorted
+        n = self.count
+        if n == self.size:
+            # Drop the oldest value from the sorted window
+            old = self.ring[self.head]
+            i = 0
+            while s[i] != old:
+                i += 1
+            while i < n - 1:
+                s[i] = s[i + 1]
+                i += 1
+            n -= 1
+        else:
+            self.count += 1
+        self.ring[self.head] = x
+        self.head += 1
+        if self.head == self.size:
+            self.head = 0
+        i = n
+        while i > 0 and s[i - 1] > x:
+            s[i] = s[i - 1]
+            i -= 1
+        s[i] = x
+        return s[self.count >> 1]
+
+    def value(self):
+        if not self.count:
+            return None
+        return float(self.sorted[self.count >> 1])
+
+
+class Decimator:
+    """Oversampling: the mean of every factor samples, push() returns None
+       until a block is complete."""
+
+    def __init__(self, factor=16):
+        self.factor = factor
+        self.acc = 0
+        self.n = 0
+        self.out = None
+
+    def reset(self):
+        self.acc = 0
+        self.n = 0
+        self.out = None
+
+    def push(self, x):
+        self.acc += x
+        self.n += 1
+        if self.n < self.factor:
+            return None
+        self.out = self.acc
+        self.acc = 0
+        self.n = 0
+        return self.out // self.factor
+
+    def value(self):
+        if self.out is None:
+            return None
+        return self.out / self.factor
+
+
+class Pipeline:
+    """Stages in series, e.g. Pipeline(SlidingMedian(5), Ema(6)). A stage
+       returning None (a decimator between blocks) stops the push."""
+
+    def __init__(self, *stages):
+        self.stages = stages
+
+    def reset(self):
+        for s in self.stages:
+            s.reset()
+
+    def push(self, x):
+        for s in self.stages:
+            x = s.push(x)
+            if x is None:
+                return None
+        return x
+
+    def value(self):
+        return self.stages[-1].value()
@@ -0,0 +1,277 @@
+"""
+Nextion serial protocol.
+
+Bytes coming from the display are split into 0xFF 0xFF 0xFF terminated
+frames in a reusable buffer. Touch events are dispatched to the handlers
+registered for their frame, replies (numeric, string, transparent data
+ready/done, errors) resolve the oldest request waiting for them.
+
+While a transparent transfer (addt) runs, the display takes every byte as
+waveform data, so commands sent meanwhile by other tasks are held and
+written once the transfer is over. get() waits for it to end before
+sending its request.
+"""
+
+import uasyncio as asyncio
+
+import prof
+
+END_CMD = b'\xFF\xFF\xFF'
+
+TOUCH_EVENT = 0x65
+STRING_DATA = 0x70
+NUMERIC_DATA = 0x71
+TRANSPARENT_DONE = 0xFD
+TRANSPARENT_READY = 0xFE
+# Sent after every successful command when bkcmd is 1 or 3
+SUCCESS = 0x01
+# Other codes up to this one are errors (invalid instruction, component,
+# variable, ...)
+ERROR_MAX = 0x24
+
+# Payload length of the frames that can contain 0xFF bytes
+_PAYLOAD_LEN = {
+    NUMERIC_DATA: 4,
+    0x67: 5,  # touch coordinate (awake)
+    0x68: 5,  # touch coordinate (sleep)
+}
+
+_GET_CODES = (STRING_DATA, NUMERIC_DATA)
+
+# The display buffers at most 1024 bytes of transparent data
+ADDT_MAX = 1024
+
+
+class Nextion:
+    def __init__(self, uart, size=64):
+        self.uart = uart
+        self.buf = bytearray(size)
+        self.rx = bytearray(size)
+        self.n = 0
+        self.handlers = {}
+        # Called with the code of an error no request is waiting for
+        self.on_error = None
+        # [codes, event, value] of the requests waiting for a reply
+        self.pending = []
+        # Commands written during a transparent transfer, None otherwise
+        self.held = None
+        self.held_cmds = 0
+
+    def _write(self, data, cmds=0):
+        if self.held is not None:
+            self.held.extend(data)
+            self.held_cmds += cmds
+            return
+        self._out(data, cmds)
+
+    def _out(self, data, cmds=0):
+        self.uart.write(data)
+        if prof.ENABLED:
+            prof.count("uart_bytes", len(data))
+            prof.count("uart_cmds", cmds)
+
+    def send(self, cmd):
+        self._write(cmd.encode() + END_CMD, 1)
+
+    def send_all(self, cmds):
+        """Send several commands with one UART write."""
+        buf = bytearray()
+        for cmd in cmds:
+            buf.extend(cmd.encode())
+            buf.extend(END_CMD)
+        self._write(buf, len(cmds))
+
+    def on(self, frame, handler):
+        """Call handler(frame) when this frame (terminator included) is
+           received, e.g. a touch event."""
+        self.handlers[bytes(frame)] = handler
+
+    def feed(self, data, n=None):
+        """Parse n bytes of data, dispatching every complete frame."""
+        buf = self.buf
+        for i in range(len(data) if n is None else n):
+            if self.n == len(buf):
+                # Garbage without terminator, drop it
+                self.n = 0
+            buf[self.n] = data[i]
+            self.n += 1
+            if self.n >= 4 and buf[self.n - 1] == 0xFF and \
+                    buf[self.n - 2] == 0xFF and buf[self.n - 3] == 0xFF:
+                if self.n - 4 >= _PAYLOAD_LEN.get(buf[0], 0):
+                    self._dispatch(self.n)
+                    self.n = 0
+
+    def _dispatch(self, n):
+        code = self.buf[0]
+        if code == SUCCESS:
+            return
+        frame = memoryview(self.buf)[:n]
+        if code == TOUCH_EVENT or not self._resolve(code, frame):
+            handler = self.handlers.get(bytes(frame))
+            if handler is not None:
+                try:
+                    handler(frame)
+                except Exception as e:
+                    # Keep reading the display whatever a handler does
+                    print("nextion: handler for", bytes(frame), "failed:",
+                          repr(e))
+            elif code <= ERROR_MAX and self.on_error is not None:
+                self.on_error(code)
+            else:
+                print("nextion:", bytes(frame))
+
+    def _resolve(self, code, frame):
+        for p in self.pending:
+            if code in p[0] or (code <= ERROR_MAX and p[0] is _GET_CODES):
+                if code == NUMERIC_DATA:
+                    v = frame[1] | frame[2] << 8 | frame[3] << 16 | frame[4] << 24
+                    p[2] = v - 0x100000000 if v & 0x80000000 else v
+                elif code == STRING_DATA:
+                    p[2] = bytes(frame[1:-3]).decode()
+                elif code > ERROR_MAX:
+                    p[2] = True
+                self.pending.remove(p)
+                p[1].set()
+                return True
+        return False
+
+    async def _request(self, codes, timeout_ms):
+        p = [codes, asyncio.Event(), None]
+        self.pending.append(p)
+        try:
+            await asyncio.wait_for_ms(p[1].wait(), timeout_ms)
+        except asyncio.TimeoutError:
+            if p in self.pending:
+                self.pending.remove(p)
+        return p[2]
+
+    async def _idle(self):
+        while self.held is not None:
+            # A transfer is running
+            await asyncio.sleep_ms(10)
+
+    async def get(self, attr, timeout_ms=200):
+        """Value of a numeric or text attribute, None if the display
+           reported an error or did not answer. Waits for a running
+           transfer to end, the timeout starts when the command is
+           written."""
+        await self._idle()
+        self.send("get " + attr)
+        return await self._request(_GET_CODES, timeout_ms)
+
+    async def wait_for(self, code, timeout_ms=500):
+        """Wait for a <code> 0xFF 0xFF 0xFF reply, False on timeout."""
+        return bool(await self._request((code,), timeout_ms))
+
+    async def addt(self, obj_id, channel, data, timeout_ms=500):
+        """Upload data (bytes, one per pixel column) to a waveform channel
+           with transparent data transfer. Each chunk waits for the display
+           to be ready and to acknowledge it, returns False if it does not
+           answer. Other commands are held until it is over."""
+        await self._idle()
+        self.held = bytearray()
+        self.held_cmds = 0
+        try:
+            for i in range(0, len(data), ADDT_MAX):
+                chunk = data[i:i + ADDT_MAX]
+                self._out("addt {},{},{}".format(obj_id, channel, len(chunk)))
+                self._out(END_CMD, 1)
+                if not await self.wait_for(TRANSPARENT_READY, timeout_ms):
+                    return False
+                self._out(chunk)
+                if not await self.wait_for(TRANSPARENT_DONE, timeout_ms):
+                    return False
+            return True
+        finally:
+            held = self.held
+            self.held = None
+            if held:
+                self._out(held, self.held_cmds)
+
+    async def run(self, period_ms=10):
+        """Read the UART and dispatch frames forever."""
+        while True:
+            while self.uart.any():
+                n = self.uart.readinto(self.rx)
+                if not n:
+                    break
+                self.feed(self.rx, n)
+            await asyncio.sleep_ms(period_ms)
+
+
+class Widgets:
+    """Last value written to each widget attribute. A command is only built
+       and emitted when the value changes. With coalesce, changes are
+       queued and written in a single UART write by flush().
+
+       Values are tracked as written, the display does not confirm
+       assignments. It does report failed ones, error replies do not say
+       which command failed so the attributes of the last flush are
+       forgotten and written again on their next update."""
+
+    def __init__(self, display, coalesce=True):
+        self.display = display
+        self.coalesce = coalesce
+        self.values = {}
+        # attribute -> (value, command)
+        self.queued = {}
+        # Attributes written by the last flush
+        self.written = []
+        self.sent = 0
+        self.suppressed = 0
+        self.errors = 0
+        display.on_error = self._error
+
+    def _current(self, attr):
+        q = self.queued.get(attr)
+        if q is not None:
+            return q[0]
+        return self.values.get(attr)
+
+    def _set(self, attr, value, cmd_fmt, fmt):
+        if value is not None and self._current(attr) == value:
+            self.suppressed += 1
+            return
+        if attr in self.queued:
+            # Replaced before being written
+            self.suppressed += 1
+        v = fmt.format(value) if isinstance(fmt, str) else fmt(value)
+        self.queued[attr] = (value, cmd_fmt.format(attr, v))
+        if not self.coalesce:
+            self.flush()
+
+    def text(self, name, value, fmt='{}'):
+        """Set name.txt to value formatted by fmt, a format string or a
+           function. Compare on the raw value (e.g. a rounded temperature)
+           so unchanged widgets cost no string building."""
+        self._set(name + ".txt", value, '{}="{}"', fmt)
+
+    def val(self, name, value):
+        self._set(name + ".val", value, '{}={}', '{}')
+
+    def flush(self):
+        if not self.queued:
+            return
+        cmds = []
+        self.written.clear()
+        for attr in self.queued:
+            value, cmd = self.queued[attr]
+            self.values[attr] = value
+            self.written.append(attr)
+            cmds.append(cmd)
+        self.queued.clear()
+        self.display.send_all(cmds)
+        self.sent += len(cmds)
+
+    def _error(self, code):
+        self.errors += 1
+        for attr in self.written:
+            self.values.pop(attr, None)
+        self.written.clear()
+
+    def page(self, name):
+        """Change page, the display resets its widgets so forget them."""
+        self.values.clear()
+        self.queued.clear()
+        self.written.clear()
+        self.display.send("page " + name)
@@ -0,0 +1,114 @@
+"""
+Lightweight profiling: counters and ticks_us span timers.
+
+Disabled by default. Hot paths guard their counters with
+
+    if prof.ENABLED:
+        prof.count("i2c")
+
+so the cost when disabled is one attribute lookup. timed() only wraps
+a function when profiling is already enabled at definition time, otherwise
+it returns the function untouched.
+
+There is no GC hook in MicroPython: a collection is counted when the
+allocated heap shrinks between two samples taken by run().
+"""
+
+import gc
+import utime as time
+
+ENABLED = False
+
+counters = {}
+# name -> [calls, total us, max us]
+spans = {}
+
+_gc = [0, 0]  # last mem_alloc, collections
+
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+
+def count(name, n=1):
+    counters[name] = counters.get(name, 0) + n
+
+
+def start():
+    return time.ticks_us()
+
+
+def stop(name, t0):
+    dt = time.ticks_diff(time.ticks_us(), t0)
+    s = spans.get(name)
+    if s is None:
+        spans[name] = [1, dt, dt]
+        return
+    s[0] += 1
+    s[1] += dt
+    if dt > s[2]:
+        s[2] = dt
+
+
+def timed(name):
+    def decorator(f):
+        if not ENABLED:
+            return f
+
+        def wrapper(*args, **kwargs):
+            t0 = time.ticks_us()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                stop(name, t0)
+        return wrapper
+    return decorator
+
+
+def _mem():
+    try:
+        return gc.mem_alloc(), gc.mem_free()
+    except AttributeError:
+        # CPython (host simulation)
+        return 0, 0
+
+
+def sample_gc():
+    alloc = _mem()[0]
+    if alloc < _gc[0]:
+        _gc[1] += 1
+    _gc[0] = alloc
+
+
+def reset():
+    counters.clear()
+    spans.clear()
+    _gc[1] = 0
+
+
+def stats_line():
+    """Compact summary since the last reset, spans as calls/avg/max us."""
+    parts = []
+    for name in sorted(counters):
+        parts.append("{}={}".format(name, counters[name]))
+    for name in sorted(spans):
+        s = spans[name]
+        parts.append("{}={}/{}/{}".format(name, s[0], s[1] // s[0], s[2]))
+    parts.append("gc={}".format(_gc[1]))
+    parts.append("free={}".format(_mem()[1]))
+    return " ".join(parts)
+
+
+async def run(report, sample_ms=50, report_ms=5000):
+    """Sample the heap every sample_ms, every report_ms call
+       report(stats_line()) and reset."""
+    import uasyncio as asyncio
+    t0 = time.ticks_ms()
+    while True:
+        await asyncio.sleep_ms(sample_ms)
+        sample_gc()
+        if time.ticks_diff(time.ticks_ms(), t0) >= report_ms:
+            t0 = time.ticks_ms()
+            report(stats_line())
+            reset()
@@ -0,0 +1,139 @@
+"""
+Round-robin scanning of several thermocouples on several ADS1115.
+
+A timer ticks once per conversion time plus the I2C time of a read (or
+the I2C time of reading every chip if that is longer). On
+each tick every chip is read with read_rev, which returns the conversion
+of the previous probe and starts the next one, so all chips convert in
+parallel while the others are being read. The conversion starts at the
+end of the bus transaction, the I2C time is measured when the scan
+starts. When a tick comes less than a conversion time after the start
+(a late tick followed by an early one) the chip's OS bit is polled once:
+the conversion time includes the 10% clock tolerance so it is usually
+done, otherwise the chip is left for the next tick.
+
+The config words are computed once. A chip with a single probe runs in
+continuous mode: its config is written once and each tick only reads the
+conversion register.
+
+    scan = Scanner([(adc1, 0, 1), (adc1, 2, 3), (adc2, 0, None)])
+    scan.start()
+    scan.temperature(0)
+"""
+
+from array import array
+from machine import Timer
+import utime as time
+
+import thermocouple
+
+# ADS1115 samples per second by rate index
+_SPS = (8, 16, 32, 64, 128, 250, 475, 860)
+
+_MODE_SINGLE = const(0x0100)
+
+
+class Scanner:
+    def __init__(self, probes, rate=7, margin=1.1):
+        """probes: [(adc, channel1, channel2), ...]. The ADS1115 clock is
+           only accurate to 10%, a conversion is given margin times its
+           nominal time."""
+        self.probes = probes
+        self.rate = rate
+        self.conv_us = int(1000000 * margin) // _SPS[rate]
+        # Longest read_rev, measured by start()
+        self.i2c_us = 0
+        self.freq = 1000000 // self.conv_us
+        self.raw = array('h', bytes(2 * len(probes)))
+        self.counts = array('I', bytes(4 * len(probes)))
+        self.ticks = 0
+        self.polls = 0
+        self.skipped = 0
+        # [adc, probe indexes, config words, position, start ticks_us]
+        # per chip
+        self.chips = []
+        for i in range(len(probes)):
+            adc, channel1, channel2 = probes[i]
+            chip = None
+            for c in self.chips:
+                if c[0] is adc:
+                    chip = c
+            if chip is None:
+                chip = [adc, array('B'), array('H'), 0, 0]
+                self.chips.append(chip)
+            adc.set_conv(rate, channel1, channel2)
+            chip[1].append(i)
+            chip[2].append(adc.mode)
+        self.timer = None
+        self._handler = self._tick
+
+    def start(self):
+        self.i2c_us = 0
+        for chip in self.chips:
+            adc = chip[0]
+            chip[3] = 0
+            if len(chip[1]) == 1:
+                adc.mode = chip[2][0] & ~_MODE_SINGLE
+            else:
+                adc.mode = chip[2][0]
+            # Writes the config, starting the first conversion
+            t0 = time.ticks_us()
+            adc.read_rev()
+            chip[4] = time.ticks_us()
+            self.i2c_us = max(self.i2c_us, time.ticks_diff(chip[4], t0))
+        # A tick reads every chip, the bus may be what limits the rate
+        period_us = max(self.conv_us + self.i2c_us,
+                        len(self.chips) * self.i2c_us)
+        self.freq = 1000000 // period_us
+        self.timer = Timer(mode=Timer.PERIODIC, freq=self.freq,
+                           callback=self._handler)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def _tick(self, t):
+        # Timer callback, does not allocate
+        self.ticks += 1
+        for chip in self.chips:
+            adc = chip[0]
+            idx = chip[1]
+            pos = chip[3]
+            i = idx[pos]
+            if len(idx) == 1:
+                self.raw[i] = adc.alert_read()
+            # Per chip, the chips before it took bus time
+            elif time.ticks_diff(time.ticks_us(), chip[4]) < self.conv_us and \
+                    not self._polled(adc):
+                self.skipped += 1
+                continue
+            else:
+                nxt = pos + 1
+                if nxt == len(idx):
+                    nxt = 0
+                adc.mode = chip[2][nxt]
+                self.raw[i] = adc.read_rev()
+                chip[3] = nxt
+                chip[4] = time.ticks_us()
+            self.counts[i] += 1
+
+    def _polled(self, adc):
+        self.polls += 1
+        return adc.conversion_ready()
+
+    def samples_per_second(self):
+        """Total rate, one reading per chip and tick."""
+        return self.freq * len(self.chips)
+
+    def mv(self, i):
+        return abs(self.probes[i][0].raw_to_v(self.raw[i])) * 1000
+
+    def temperature(self, i):
+        """Temperature of probe i, None before its first reading."""
+        if not self.counts[i]:
+            return None
+        return thermocouple.mv_to_c(self.mv(i))
+
+    def temperatures(self):
+        return [self.temperature(i) for i in range(len(self.probes))]
@@ -0,0 +1,712 @@
+"""
+Host (CPython) simulation of the board.
+
+install() registers fake machine, utime, uasyncio and micropython modules
+so the firmware modules can be imported and run off-device:
+
+    import sim
+    board = sim.install()
+    import main
+    asyncio.run(main.main())
+
+The fakes model what matters for timing: ADS1115 conversion latency for
+each data rate, ALERT/RDY edges in continuous mode, UART bytes at the
+configured baud rate and a Nextion answering get/addt commands. A first
+order thermal model heated by the PWM duty on GP7 stands in for the oven.
+
+machine.Timer callbacks run on a thread, so like on the board they are
+on time while the event loop is busy or sleeping. Device updates and
+callbacks hold one lock, which disable_irq() takes as well.
+
+For results that do not depend on the host, use_clock(SimClock(board))
+replaces the time: it stands still except for the I2C bus time and
+advance(), which runs the timer callbacks that fall due.
+"""
+
+import asyncio
+import builtins
+import math
+import random
+import sys
+import threading
+import time
+import types
+
+_monotonic = time.perf_counter
+# SimClock in use, None for real time
+_CLOCK = None
+
+# Held by interrupt handlers and device updates
+_IRQ = threading.RLock()
+# How late time.sleep() may wake up
+_OVERSLEEP = 0.0002
+
+
+# ---------------------------------------------------------------------------
+# Oven
+
+
+# NIST ITS-90 type K EMF in mV (Tref = 0 C)
+_EMF_NEG = (0.0, 0.394501280250e-01, 0.236223735980e-04, -0.328589067840e-06,
+            -0.499048287770e-08, -0.675090591730e-10, -0.574103274280e-12,
+            -0.310888728940e-14, -0.104516093650e-16, -0.198892668780e-19,
+            -0.163226974860e-22)
+_EMF_POS = (-0.176004136860e-01, 0.389212049750e-01, 0.185587700320e-04,
+            -0.994575928740e-07, 0.318409457190e-09, -0.560728448890e-12,
+            0.560750590590e-15, -0.320207200030e-18, 0.971511471520e-22,
+            -0.121047212750e-25)
+_EMF_EXP = (0.118597600000e+00, -0.118343200000e-03, 0.126968600000e+03)
+
+
+def emf_mv(t):
+    coefs = _EMF_NEG if t < 0 else _EMF_POS
+    e = 0.0
+    for c in reversed(coefs):
+        e = e * t + c
+    if t >= 0:
+        e += _EMF_EXP[0] * math.exp(_EMF_EXP[1] * (t - _EMF_EXP[2]) ** 2)
+    return e
+
+
+class ThermalModel:
+    """First order oven: the temperature goes toward ambient + heater duty
+       * gain_c with a time constant tau_s. speed runs the model faster
+       than real time."""
+
+    def __init__(self, ambient=20.0, gain_c=120.0, tau_s=1800.0, speed=1.0):
+        self.ambient = ambient
+        self.gain_c = gain_c
+        self.tau_s = tau_s
+        self.speed = speed
+        self.temp = ambient
+        self.heater = 0.0
+
+    def step(self, dt):
+        target = self.ambient + self.heater * self.gain_c
+        k = min(dt * self.speed / self.tau_s, 1.0)
+        self.temp += (target - self.temp) * k
+
+    def thermocouple_v(self):
+        return emf_mv(self.temp) / 1000
+
+
+# ---------------------------------------------------------------------------
+# Board
+
+
+class Board:
+    def __init__(self):
+        self.pins = {}
+        self.buses = {}
+        self.uarts = {}
+        self.devices = []
+        self.oven = ThermalModel()
+        # PWM duty on this pin is the heater power
+        self.heater_pin = 7
+
+    def pin(self, id):
+        if id not in self.pins:
+            self.pins[id] = PinState(id)
+        return self.pins[id]
+
+    def bus(self, id):
+        if id not in self.buses:
+            self.buses[id] = I2CBus(id)
+        return self.buses[id]
+
+    def uart(self, id):
+        if id not in self.uarts:
+            self.uarts[id] = UartPort(id)
+        return self.uarts[id]
+
+    def tick(self, dt):
+        with _IRQ:
+            self.oven.step(dt)
+            for dev in self.devices:
+                dev.tick()
+
+    async def run(self, period_ms=1):
+        """Hardware: thermal model, conversions and interrupts."""
+        last = _monotonic()
+        while True:
+            await asyncio.sleep(period_ms / 1000)
+            now = _monotonic()
+            self.tick(now - last)
+            last = now
+
+
+class PinState:
+    def __init__(self, id):
+        self.id = id
+        self.value = 1
+        self.handler = None
+        self.trigger = None
+        self.edges = 0
+
+    def fire(self, pin):
+        self.edges += 1
+        if self.handler is not None:
+            self.handler(pin)
+
+
+class I2CBus:
+    def __init__(self, id):
+        self.id = id
+        self.freq = 100000
+        self.devices = {}
+        self.transactions = 0
+        self.bytes = 0
+
+    def transfer(self, address, n):
+        if address not in self.devices:
+            raise OSError(19)  # ENODEV
+        self.transactions += 1
+        # address + register + data
+        self.bytes += n + 2
+        return self.devices[address]
+
+    def busy_s(self):
+        """Bus time used so far, 9 bit times per byte."""
+        return self.bytes * 9 / self.freq
+
+
+class UartPort:
+    def __init__(self, id):
+        self.id = id
+        self.baudrate = 9600
+        self.bits = 8
+        self.stop = 1
+        self.peer = None
+        self.tx_bytes = 0
+        self.tx_writes = []
+        self.tx_busy = 0.0
+        self.rx = []
+        self.rx_busy = 0.0
+
+    def byte_s(self):
+        return (1 + self.bits + self.stop) / self.baudrate
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        data = bytes(data)
+        now = _monotonic()
+        done = max(now, self.tx_busy) + len(data) * self.byte_s()
+        self.tx_busy = done
+        self.tx_bytes += len(data)
+        self.tx_writes.append(now)
+        if self.peer is not None:
+            try:
+                asyncio.get_running_loop().call_later(
+                    done - now, self.peer.receive, data)
+            except RuntimeError:
+                self.peer.receive(data)
+        return len(data)
+
+    def inject(self, data):
+        """Bytes sent by the peer, readable once transmitted. Returns the
+           time the last byte arrives."""
+        now = _monotonic()
+        done = max(now, self.rx_busy) + len(data) * self.byte_s()
+        self.rx_busy = done
+        self.rx.append((done, bytearray(data)))
+        return done
+
+    def available(self):
+        now = _monotonic()
+        n = 0
+        for t, chunk in self.rx:
+            if t > now:
+                break
+            n += len(chunk)
+        return n
+
+    def take(self, n):
+        out = bytearray()
+        now = _monotonic()
+        while self.rx and len(out) < n and self.rx[0][0] <= now:
+            chunk = self.rx[0][1]
+            k = min(n - len(out), len(chunk))
+            out += chunk[:k]
+            del chunk[:k]
+            if not chunk:
+                self.rx.pop(0)
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Devices
+
+
+# ADS1115 data rates by DR bits
+_SPS = (8, 16, 32, 64, 128, 250, 475, 860)
+_FULL_SCALE = (6.144, 4.096, 2.048, 1.024, 0.512, 0.256, 0.256, 0.256)
+_MUX = ((0, 1), (0, 3), (1, 3), (2, 3), (0, None), (1, None), (2, None),
+        (3, None))
+
+
+class FakeADS1115:
+    """Single-shot conversions keep OS at 0 for a conversion time,
+       continuous mode converts every 1/SPS and pulses ALERT/RDY when the
+       comparator queue is enabled."""
+
+    def __init__(self, board, bus=1, address=0x48, alert_pin=None, noise=1.0):
+        self.board = board
+        self.alert_pin = alert_pin
+        self.noise = noise
+        # channel -> function returning the input voltage
+        self.inputs = {(0, None): board.oven.thermocouple_v}
+        self.config = 0x8583
+        self.lo_thresh = 0x8000
+        self.hi_thresh = 0x7FFF
+        self.result = 0
+        self.busy_until = 0.0
+        self.next_ready = None
+        self.ready = 0
+        self.conversions = 0
+        self.result_reads = 0
+        # Conversion register read while a single-shot conversion runs
+        self.early_reads = 0
+        board.bus(bus).devices[address] = self
+        board.devices.append(self)
+
+    def period(self):
+        return 1 / _SPS[(self.config >> 5) & 7]
+
+    def _sample(self):
+        v = self.inputs.get(_MUX[(self.config >> 12) & 7], lambda: 0.0)()
+        fs = _FULL_SCALE[(self.config >> 9) & 7]
+        raw = int(round(v / fs * 32767 + random.gauss(0, self.noise)))
+        self.result = max(-32768, min(32767, raw)) & 0xFFFF
+        self.conversions += 1
+
+    def _update(self, now):
+        if self.next_ready is not None:
+            while now >= self.next_ready:
+                self._sample()
+                self.next_ready += self.period()
+                if self.config & 0x3 != 0x3:
+                    self.ready += 1
+        elif self.busy_until and now >= self.busy_until:
+            self._sample()
+            self.busy_until = 0.0
+
+    def write_register(self, reg, value):
+        now = _monotonic()
+        self._update(now)
+        if reg == 1:
+            self.config = value & 0x7FFF
+            if value & 0x0100:
+                self.next_ready = None
+                if value & 0x8000:
+                    self.busy_until = now + self.period()
+            else:
+                self.next_ready = now + self.period()
+        elif reg == 2:
+            self.lo_thresh = value
+        elif reg == 3:
+            self.hi_thresh = value
+
+    def read_register(self, reg):
+        self._update(_monotonic())
+        if reg == 0:
+            self.result_reads += 1
+            if self.busy_until:
+                self.early_reads += 1
+            return self.result
+        if reg == 1:
+            busy = self.busy_until != 0.0
+            return self.config | (0 if busy else 0x8000)
+        if reg == 2:
+            return self.lo_thresh
+        return self.hi_thresh
+
+    def tick(self):
+        self._update(_monotonic())
+        if self.alert_pin is None:
+            return
+        pin = self.board.pin(self.alert_pin)
+        while self.ready:
+            self.ready -= 1
+            pin.fire(_modules['machine'].Pin(self.alert_pin))
+
+
+class FakeNextion:
+    """Answers get (numeric attributes, .w of the waveform), addt
+       transparent transfers and remembers the other assignments."""
+
+    def __init__(self, board, uart=1, width=270):
+        self.port = board.uart(uart)
+        self.port.peer = self
+        self.width = width
+        self.values = {}
+        self.page = None
+        self.buf = bytearray()
+        self.transparent = 0
+        self.commands = 0
+        self.addt_bytes = 0
+        self.addt_data = bytearray()
+        self.addt_done = []
+
+    def receive(self, data):
+        for b in data:
+            if self.transparent:
+                self.addt_bytes += 1
+                self.addt_data.append(b)
+                self.transparent -= 1
+                if not self.transparent:
+                    self.addt_done.append(_monotonic())
+                    self.reply(b'\xfd')
+                continue
+            self.buf.append(b)
+            if self.buf[-3:] == b'\xff\xff\xff':
+                cmd = bytes(self.buf[:-3])
+                self.buf = bytearray()
+                self.command(cmd.decode('utf-8', 'replace'))
+
+    def reply(self, data):
+        self.port.inject(bytes(data) + b'\xff\xff\xff')
+
+    def command(self, cmd):
+        self.commands += 1
+        if cmd.startswith("get "):
+            attr = cmd[4:]
+            v = self.width if attr.endswith(".w") else self.values.get(attr)
+            if isinstance(v, int):
+                self.reply(b'\x71' + (v & 0xFFFFFFFF).to_bytes(4, 'little'))
+            elif v is not None:
+                self.reply(b'\x70' + v.encode())
+            else:
+                self.reply(b'\x1a')
+        elif cmd.startswith("addt "):
+            self.addt_data = bytearray()
+            self.transparent = int(cmd[5:].split(",")[2])
+            self.reply(b'\xfe')
+        elif cmd.startswith("page "):
+            self.page = cmd[5:]
+        elif "=" in cmd:
+            attr, v = cmd.split("=", 1)
+            if v.startswith('"'):
+                self.values[attr] = v.strip('"')
+            else:
+                try:
+                    self.values[attr] = int(v)
+                except ValueError:
+                    # Invalid variable
+                    self.reply(b'\x1a')
+
+    def touch(self, frame):
+        """Send a touch event frame, returns when its last byte arrives."""
+        return self.port.inject(frame)
+
+
+# ---------------------------------------------------------------------------
+# Simulated time
+
+
+class SimClock:
+    """Seconds since the clock was made: advance() plus the time the I2C
+       transfers took on the bus. Timer callbacks run from advance() when
+       they fall due. Every late_every-th callback comes late_s late, the ticks
+       missed meanwhile then run back to back, as when the timer interrupt
+       is held up."""
+
+    def __init__(self, board, late_every=0, late_s=0.0):
+        self.board = board
+        self.late_every = late_every
+        self.late_s = late_s
+        self.t = 0.0
+        # Bytes already on the buses
+        self.bytes0 = dict((id, b.bytes) for id, b in board.buses.items())
+        self.calls = 0
+        # [deadline, timer, stopped event]
+        self.timers = []
+
+    def __call__(self):
+        t = self.t
+        for id, b in self.board.buses.items():
+            t += (b.bytes - self.bytes0.get(id, 0)) * 9 / b.freq
+        return t
+
+    def add(self, timer, stopped):
+        self.timers.append([self() + timer.period, timer, stopped])
+
+    def advance(self, dt):
+        end = self() + dt
+        while True:
+            self.timers = [e for e in self.timers if not e[2].is_set()]
+            due = None
+            for e in self.timers:
+                if due is None or e[0] < due[0]:
+                    due = e
+            if due is None or due[0] > end:
+                break
+            self.calls += 1
+            at = due[0]
+            if self.late_every and self.calls % self.late_every == 0:
+                at += self.late_s
+            # A late callback runs at once when the previous one overran
+            self.t += max(0.0, at - self())
+            timer = due[1]
+            with _IRQ:
+                timer.callback(timer)
+            if timer.mode == timer.ONE_SHOT:
+                due[2].set()
+            due[0] += timer.period
+        self.t += max(0.0, end - self())
+
+
+def use_clock(clock):
+    """Run the board on clock, None goes back to real time."""
+    global _monotonic, _CLOCK
+    _CLOCK = clock
+    _monotonic = time.perf_counter if clock is None else clock
+
+
+# ---------------------------------------------------------------------------
+# Fake MicroPython modules
+
+
+BOARD = None
+_modules = {}
+
+
+def _ticks_ms():
+    return int(_monotonic() * 1000)
+
+
+def _ticks_us():
+    return int(_monotonic() * 1000000)
+
+
+def _ticks_diff(a, b):
+    return a - b
+
+
+def _ticks_add(a, b):
+    return a + b
+
+
+def _utime():
+    m = types.ModuleType("utime")
+    m.ticks_ms = _ticks_ms
+    m.ticks_us = _ticks_us
+    m.ticks_diff = _ticks_diff
+    m.ticks_add = _ticks_add
+    m.time = time.time
+    m.sleep = time.sleep
+    m.sleep_ms = lambda ms: time.sleep(ms / 1000)
+    m.sleep_us = lambda us: time.sleep(us / 1000000)
+    m.localtime = time.localtime
+    return m
+
+
+def _uasyncio():
+    m = types.ModuleType("uasyncio")
+    m.__dict__.update(asyncio.__dict__)
+    m.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+    m.wait_for_ms = lambda aw, ms: asyncio.wait_for(aw, ms / 1000)
+    m.TimeoutError = asyncio.TimeoutError
+    return m
+
+
+def _micropython():
+    m = types.ModuleType("micropython")
+    m.const = lambda x: x
+    m.alloc_emergency_exception_buf = lambda n: None
+    m.schedule = lambda f, arg: f(arg)
+    m.mem_info = lambda *args: None
+    return m
+
+
+def _disable_irq():
+    _IRQ.acquire()
+    return 0
+
+
+def _enable_irq(state):
+    _IRQ.release()
+
+
+def _machine(board):
+    m = types.ModuleType("machine")
+
+    class Pin:
+        IN = 0
+        OUT = 1
+        OPEN_DRAIN = 2
+        PULL_UP = 1
+        PULL_DOWN = 2
+        IRQ_FALLING = 4
+        IRQ_RISING = 8
+
+        def __init__(self, id, mode=-1, pull=-1, value=None):
+            self.id = id
+            self.state = board.pin(id)
+            if value is not None:
+                self.state.value = value
+
+        def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING,
+                hard=False):
+            self.state.handler = handler
+            self.state.trigger = trigger
+
+        def value(self, v=None):
+            if v is None:
+                return self.state.value
+            self.state.value = 1 if v else 0
+
+        def on(self):
+            self.value(1)
+
+        def off(self):
+            self.value(0)
+
+        def __call__(self, v=None):
+            return self.value(v)
+
+    class I2C:
+        def __init__(self, id, scl=None, sda=None, freq=400000):
+            self.bus = board.bus(id)
+            self.bus.freq = freq
+
+        def writeto_mem(self, addr, memaddr, buf):
+            dev = self.bus.transfer(addr, len(buf))
+            dev.write_register(memaddr, (buf[0] << 8) | buf[1])
+
+        def readfrom_mem_into(self, addr, memaddr, buf):
+            dev = self.bus.transfer(addr, len(buf))
+            v = dev.read_register(memaddr)
+            buf[0] = v >> 8
+            buf[1] = v & 0xFF
+
+        def scan(self):
+            return sorted(self.bus.devices)
+
+    class UART:
+        def __init__(self, id, baudrate=9600, **kwargs):
+            self.port = board.uart(id)
+            self.init(baudrate, **kwargs)
+
+        def init(self, baudrate=9600, bits=8, parity=None, stop=1, **kwargs):
+            self.port.baudrate = baudrate
+            self.port.bits = bits
+            self.port.stop = stop
+
+        def write(self, buf):
+            return self.port.write(buf)
+
+        def any(self):
+            return self.port.available()
+
+        def read(self, n=-1):
+            data = self.port.take(n if n >= 0 else self.port.available())
+            return bytes(data) if data else None
+
+        def readinto(self, buf, n=None):
+            data = self.port.take(len(buf) if n is None else n)
+            buf[:len(data)] = data
+            return len(data) or None
+
+    class PWM:
+        def __init__(self, pin, freq=None, duty_u16=None):
+            self.pin = pin.id
+            self.f = 1000
+            self.duty = 0
+            if freq is not None:
+                self.freq(freq)
+            if duty_u16 is not None:
+                self.duty_u16(duty_u16)
+
+        def freq(self, f=None):
+            if f is None:
+                return self.f
+            self.f = f
+
+        def duty_u16(self, d=None):
+            if d is None:
+                return self.duty
+            self.duty = d
+            if self.pin == board.heater_pin:
+                board.oven.heater = d / 65535
+
+        def deinit(self):
+            self.duty_u16(0)
+
+    class Timer:
+        ONE_SHOT = 0
+        PERIODIC = 1
+
+        def __init__(self, id=-1, **kwargs):
+            self.stopped = None
+            if kwargs:
+                self.init(**kwargs)
+
+        def init(self, mode=PERIODIC, freq=-1, period=-1, callback=None):
+            self.deinit()
+            self.mode = mode
+            self.period = 1 / freq if freq > 0 else period / 1000
+            self.callback = callback
+            self.stopped = threading.Event()
+            if _CLOCK is not None:
+                _CLOCK.add(self, self.stopped)
+                return
+            threading.Thread(target=self._run, args=(self.stopped,),
+                             daemon=True).start()
+
+        def _run(self, stopped):
+            deadline = _monotonic() + self.period
+            while True:
+                delay = deadline - _monotonic()
+                if delay > _OVERSLEEP:
+                    time.sleep(delay - _OVERSLEEP)
+                # sleep() wakes up late, spin the rest like a hardware alarm
+                while _monotonic() < deadline:
+                    pass
+                with _IRQ:
+                    if stopped.is_set():
+                        return
+                    self.callback(self)
+                if self.mode == self.ONE_SHOT:
+                    return
+                deadline += self.period
+
+        def deinit(self):
+            # Under the lock, no callback runs once deinit returns
+            with _IRQ:
+                if self.stopped is not None:
+                    self.stopped.set()
+                    self.stopped = None
+
+    m.Pin = Pin
+    m.PWM = PWM
+    m.Timer = Timer
+    m.I2C = I2C
+    m.UART = UART
+    m.disable_irq = _disable_irq
+    m.enable_irq = _enable_irq
+    m.freq = lambda *args: 125000000
+    return m
+
+
+def install(board=None):
+    """Create the board (ADS1115 on I2C 1 with ALERT/RDY on GP6, Nextion on
+       UART 1) and register the fake modules. Returns the board, installing
+       again keeps the current one since imported firmware holds it."""
+    global BOARD
+    if board is None and BOARD is not None:
+        return BOARD
+    if board is None:
+        board = Board()
+        board.ads = FakeADS1115(board, bus=1, address=0x48, alert_pin=6)
+        board.nextion = FakeNextion(board, uart=1)
+    BOARD = board
+    _modules["machine"] = _machine(board)
+    _modules["utime"] = _utime()
+    _modules["uasyncio"] = _uasyncio()
+    _modules["micropython"] = _micropython()
+    sys.modules.update(_modules)
+    builtins.const = _modules["micropython"].const
+    # Timer threads get the interpreter within 0.1 ms, like an interrupt
+    sys.setswitchinterval(0.0001)
+    return board
@@ -0,0 +1,265 @@
+"""
+Offline thermocouple table compiler (host only, needs NumPy).
+
+Evaluates the NIST ITS-90 reference functions (EMF in mV, Tref = 0 C) for
+a thermocouple type over a temperature range and writes a table the
+firmware loads at startup (see thermocouple.load):
+
+    python tablegen.py K --tmin 0 --tmax 100 --step 0.1 -o tc_k.bin
+
+The table starts at --tmin. With --step it ends at the last point not
+past --tmax (--step 0.3 from 0 to 100 ends at 99.9). With --max-error it
+ends at --tmax and is non-uniform: starting from a fine grid, only the
+points needed for linear interpolation to stay within that many C are
+kept.
+
+Binary format, little endian: header "<4sBcBxIff" (magic b"TKTB",
+version, type, flags, number of points, tmin, step), then the float32 EMF
+of every point in mV, then, if flags has NON_UNIFORM, their float32
+temperatures. --format py writes the same table as array literals
+instead, a module for thermocouple.load_module().
+"""
+
+import argparse
+import struct
+
+import numpy as np
+
+MAGIC = b"TKTB"
+VERSION = 1
+HEADER = "<4sBcBxIff"
+NON_UNIFORM = 1
+
+# NIST SRD 60 reference functions, per type the ranges (tmin, tmax,
+# coefficients c0, c1, ..., gaussian term a0, a1, a2 or None):
+# E = sum(ci * t**i) + a0 * exp(a1 * (t - a2)**2)
+ITS90 = {
+    'B': (
+        (0.0, 630.615, (
+            0.000000000000e+00, -0.246508183460e-03, 0.590404211710e-05,
+            -0.132579316360e-08, 0.156682919010e-11, -0.169445292400e-14,
+            0.629903470940e-18,
+        ), None),
+        (630.615, 1820.0, (
+            -0.389381686210e+01, 0.285717474700e-01, -0.848851047850e-04,
+            0.157852801640e-06, -0.168353448640e-09, 0.111097940130e-12,
+            -0.445154310330e-16, 0.989756408210e-20, -0.937913302890e-24,
+        ), None),
+    ),
+    'E': (
+        (-270.0, 0.0, (
+            0.000000000000e+00, 0.586655087080e-01, 0.454109771240e-04,
+            -0.779980486860e-06, -0.258001608430e-07, -0.594525830570e-09,
+            -0.932140586670e-11, -0.102876055340e-12, -0.803701236210e-15,
+            -0.439794973910e-17, -0.164147763550e-19, -0.396736195160e-22,
+            -0.558273287210e-25, -0.346578420130e-28,
+        ), None),
+        (0.0, 1000.0, (
+            0.000000000000e+00, 0.586655087100e-01, 0.450322755820e-04,
+            0.289084072120e-07, -0.330568966520e-09, 0.650244032700e-12,
+            -0.191974955040e-15, -0.125366004970e-17, 0.214892175690e-20,
+            -0.143880417820e-23, 0.359608994810e-27,
+        ), None),
+    ),
+    'J': (
+        (-210.0, 760.0, (
+            0.000000000000e+00, 0.503811878150e-01, 0.304758369300e-04,
+            -0.856810657200e-07, 0.132281952950e-09, -0.170529583370e-12,
+            0.209480906970e-15, -0.125383953360e-18, 0.156317256970e-22,
+        ), None),
+        (760.0, 1200.0, (
+            0.296456256810e+03, -0.149761277860e+01, 0.317871039240e-02,
+            -0.318476867010e-05, 0.157208190040e-08, -0.306913690560e-12,
+        ), None),
+    ),
+    'K': (
+        (-270.0, 0.0, (
+            0.000000000000e+00, 0.394501280250e-01, 0.236223735980e-04,
+            -0.328589067840e-06, -0.499048287770e-08, -0.675090591730e-10,
+            -0.574103274280e-12, -0.310888728940e-14, -0.104516093650e-16,
+            -0.198892668780e-19, -0.163226974860e-22,
+        ), None),
+        (0.0, 1372.0, (
+            -0.176004136860e-01, 0.389212049750e-01, 0.185587700320e-04,
+            -0.994575928740e-07, 0.318409457190e-09, -0.560728448890e-12,
+            0.560750590590e-15, -0.320207200030e-18, 0.971511471520e-22,
+            -0.121047212750e-25,
+        ), (0.118597600000e+00, -0.118343200000e-03, 0.126968600000e+03)),
+    ),
+    'N': (
+        (-270.0, 0.0, (
+            0.000000000000e+00, 0.261591059620e-01, 0.109574842280e-04,
+            -0.938411115540e-07, -0.464120397590e-10, -0.263033577160e-11,
+            -0.226534380030e-13, -0.760893007910e-16, -0.934196678350e-19,
+        ), None),
+        (0.0, 1300.0, (
+            0.000000000000e+00, 0.259293946010e-01, 0.157101418800e-04,
+            0.438256272370e-07, -0.252611697940e-09, 0.643118193390e-12,
+            -0.100634715190e-14, 0.997453389920e-18, -0.608632456070e-21,
+            0.208492293390e-24, -0.306821961510e-28,
+        ), None),
+    ),
+    'R': (
+        (-50.0, 1064.18, (
+            0.000000000000e+00, 0.528961729765e-02, 0.139166589782e-04,
+            -0.238855693017e-07, 0.356916001063e-10, -0.462347666298e-13,
+            0.500777441034e-16, -0.373105886191e-19, 0.157716482367e-22,
+            -0.281038625251e-26,
+        ), None),
+        (1064.18, 1664.5, (
+            0.295157925316e+01, -0.252061251332e-02, 0.159564501865e-04,
+            -0.764085947576e-08, 0.205305291024e-11, -0.293359668173e-15,
+        ), None),
+        (1664.5, 1768.1, (
+            0.152232118209e+03, -0.268819888545e+00, 0.171280280471e-03,
+            -0.345895706453e-07, -0.934633971046e-14,
+        ), None),
+    ),
+    'S': (
+        (-50.0, 1064.18, (
+            0.000000000000e+00, 0.540313308631e-02, 0.125934289740e-04,
+            -0.232477968689e-07, 0.322028823036e-10, -0.331465196389e-13,
+            0.255744251786e-16, -0.125068871393e-19, 0.271443176145e-23,
+        ), None),
+        (1064.18, 1664.5, (
+            0.132900444085e+01, 0.334509311344e-02, 0.654805192818e-05,
+            -0.164856259209e-08, 0.129989605174e-13,
+        ), None),
+        (1664.5, 1768.1, (
+            0.146628232636e+03, -0.258430516752e+00, 0.163693574641e-03,
+            -0.330439046987e-07, -0.943223690612e-14,
+        ), None),
+    ),
+    'T': (
+        (-270.0, 0.0, (
+            0.000000000000e+00, 0.387481063640e-01, 0.441944343470e-04,
+            0.118443231050e-06, 0.200329735540e-07, 0.901380195590e-09,
+            0.226511565930e-10, 0.360711542050e-12, 0.384939398830e-14,
+            0.282135219250e-16, 0.142515947790e-18, 0.487686622860e-21,
+            0.107955392700e-23, 0.139450270620e-26, 0.797951539270e-30,
+        ), None),
+        (0.0, 400.0, (
+            0.000000000000e+00, 0.387481063640e-01, 0.332922278800e-04,
+            0.206182434040e-06, -0.218822568460e-08, 0.109968809280e-10,
+            -0.308157587720e-13, 0.454791352900e-16, -0.275129016730e-19,
+        ), None),
+    ),
+}
+
+
+def emf_mv(ttype, t):
+    """EMF in mV of a thermocouple type at temperatures t (array, C)."""
+    t = np.asarray(t, dtype=np.float64)
+    ranges = ITS90[ttype]
+    if t.min() < ranges[0][0] or t.max() > ranges[-1][1]:
+        raise ValueError("type {} is defined from {} C to {} C".format(
+            ttype, ranges[0][0], ranges[-1][1]))
+    e = np.empty_like(t)
+    for i, (lo, hi, coefs, gauss) in enumerate(ranges):
+        m = (t >= lo) & ((t < hi) if i < len(ranges) - 1 else (t <= hi))
+        e[m] = np.polynomial.polynomial.polyval(t[m], coefs)
+        if gauss is not None:
+            a0, a1, a2 = gauss
+            e[m] += a0 * np.exp(a1 * (t[m] - a2) ** 2)
+    return e
+
+
+def uniform(ttype, tmin, tmax, step):
+    """Points from tmin every step, up to tmax included."""
+    n = int(np.floor((tmax - tmin) / step + 1e-6)) + 1
+    # Rounding must not push the last point out of the type's range
+    t = np.minimum(tmin + np.arange(n) * step, tmax)
+    return t, emf_mv(ttype, t)
+
+
+def reduce(ttype, tmin, tmax, max_error, fine=0.01):
+    """Fewest points of the fine grid such that interpolating linearly in
+       mV between them gives the temperature within max_error C. The
+       grid ends at tmax, its last step may be shorter."""
+    n = int(np.ceil((tmax - tmin) / fine - 1e-6)) + 1
+    # Rounding must not push the last point out of the type's range
+    t = np.minimum(tmin + np.arange(n) * fine, tmax)
+    e = emf_mv(ttype, t)
+    keep = [0]
+    i = 0
+    while i < n - 1:
+        # Largest j whose chord i..j stays within the bound, the error grows
+        # with the chord length so bisect on it
+        lo, hi = i + 1, n - 1
+        while lo < hi:
+            j = (lo + hi + 1) // 2
+            seg_e = e[i:j + 1]
+            interp = t[i] + (seg_e - e[i]) * (t[j] - t[i]) / (e[j] - e[i])
+            if np.abs(interp - t[i:j + 1]).max() <= max_error:
+                lo = j
+            else:
+                hi = j - 1
+        keep.append(lo)
+        i = lo
+    keep = np.array(keep)
+    return t[keep], e[keep]
+
+
+def write_bin(f, ttype, t, e, non_uniform, step):
+    flags = NON_UNIFORM if non_uniform else 0
+    f.write(struct.pack(HEADER, MAGIC, VERSION, ttype.encode(), flags,
+                        len(t), float(t[0]), float(step)))
+    f.write(e.astype("<f4").tobytes())
+    if non_uniform:
+        f.write(t.astype("<f4").tobytes())
+
+
+def write_py(f, ttype, t, e, non_uniform, step):
+    def literal(name, values):
+        f.write("{} = array('f', (\n".format(name))
+        for i in range(0, len(values), 8):
+            f.write("    " + ", ".join(
+                "{:.6f}".format(v) for v in values[i:i + 8]) + ",\n")
+        f.write("))\n")
+
+    f.write("# Type {} table generated by tablegen.py\n".format(ttype))
+    f.write("from array import array\n\n")
+    f.write("TYPE = {!r}\n".format(ttype))
+    f.write("T_MIN = {!r}\n".format(float(t[0])))
+    f.write("T_STEP = {!r}\n".format(float(step)))
+    literal("TABLE_MV", e)
+    if non_uniform:
+        literal("TABLE_T", t)
+    else:
+        f.write("TABLE_T = None\n")
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    p.add_argument("type", choices=sorted(ITS90))
+    p.add_argument("--tmin", type=float, default=0.0,
+                   help="first point (C)")
+    p.add_argument("--tmax", type=float, default=100.0,
+                   help="last point (C), included")
+    p.add_argument("--step", type=float, default=0.1,
+                   help="spacing of a uniform table (C)")
+    p.add_argument("--max-error", type=float,
+                   help="non-uniform table within this error (C)")
+    p.add_argument("--format", choices=("bin", "py"), default="bin")
+    p.add_argument("-o", "--output", required=True)
+    args = p.parse_args()
+
+    try:
+        if args.max_error:
+            t, e = reduce(args.type, args.tmin, args.tmax, args.max_error)
+        else:
+            t, e = uniform(args.type, args.tmin, args.tmax, args.step)
+    except ValueError as err:
+        raise SystemExit(str(err))
+    if np.any(np.diff(e) <= 0):
+        raise SystemExit("EMF is not increasing over this range")
+
+    write = write_py if args.format == "py" else write_bin
+    with open(args.output, "w" if args.format == "py" else "wb") as f:
+        write(f, args.type, t, e, bool(args.max_error), args.step)
+    print("type {}: {} points, {} C to {} C -> {}".format(
+        args.type, len(t), t[0], t[-1], args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Thermocouple voltage -> temperature conversion.
+
+The table holds the EMF in mV (Tref = 0 C) and is compiled on the host by
+tablegen.py into a binary file read once at import (the default tc_k.bin
+is type K from 0 to 100 C every 0.1 C). Reading it with readinto into a
+preallocated float array avoids compiling a 1000 float literal on the
+board. Tables generated as array literals (tablegen.py --format py) are
+used with load_module(), e.g. once frozen into the firmware. The table
+is searched by bisection and linearly interpolated; non-uniform tables
+also carry the temperature of each point.
+
+Outside of a type K table, the NIST ITS-90 type K inverse polynomials can
+be used for the full range (-200 C to 1372 C). They are also used if no
+table could be loaded. Other types have no polynomial here, generate a
+table covering the whole range instead.
+"""
+
+from array import array
+import struct
+
+TABLE_FILE = "tc_k.bin"
+
+_MAGIC = b"TKTB"
+_VERSION = 1
+_HEADER = "<4sBcBxIff"
+_NON_UNIFORM = 1
+
+TYPE = "K"
+T_MIN = 0.0
+T_STEP = 0.1
+TABLE_MV = array('f')
+# Temperatures of the points of a non-uniform table, None if uniform
+TABLE_T = None
+
+
+def load(path=TABLE_FILE):
+    """Load a table written by tablegen.py, it replaces the current one."""
+    with open(path, "rb") as f:
+        h = f.read(struct.calcsize(_HEADER))
+        if len(h) != struct.calcsize(_HEADER):
+            raise ValueError("truncated thermocouple table: " + path)
+        magic, version, ttype, flags, n, t_min, step = struct.unpack(
+            _HEADER, h)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("not a thermocouple table: " + path)
+        mv = _read(f, n, path)
+        t = None
+        if flags & _NON_UNIFORM:
+            t = _read(f, n, path)
+    _use(ttype.decode(), t_min, step, mv, t)
+
+
+def _read(f, n, path):
+    # A short read would leave zeros at the end of the table
+    a = array('f', bytes(4 * n))
+    if f.readinto(a) != 4 * n:
+        raise ValueError("truncated thermocouple table: " + path)
+    return a
+
+
+def load_module(name):
+    """Use the table of a module written by tablegen.py --format py."""
+    m = __import__(name)
+    _use(m.TYPE, m.T_MIN, m.T_STEP, m.TABLE_MV, m.TABLE_T)
+
+
+def _use(ttype, t_min, step, mv, t):
+    global TYPE, T_MIN, T_STEP, TABLE_MV, TABLE_T
+    TYPE = ttype
+    T_MIN = t_min
+    T_STEP = step
+    TABLE_MV = mv
+    TABLE_T = t
+
+
+# NIST ITS-90 inverse coefficients, (upper bound in mV, d0, d1, ...)
+_INVERSE = (
+    # -200 C to 0 C
+    (0.0, (0.0, 2.5173462e1, -1.1662878, -1.0833638, -8.9773540e-1,
+           -3.7342377e-1, -8.6632643e-2, -1.0450598e-2, -5.1920577e-4)),
+    # 0 C to 500 C
+    (20.644, (0.0, 2.508355e1, 7.860106e-2, -2.503131e-1, 8.315270e-2,
+              -1.228034e-2, 9.804036e-4, -4.413030e-5, 1.057734e-6,
+              -1.052755e-8)),
+    # 500 C to 1372 C
+    (54.886, (-1.318058e2, 4.830222e1, -1.646031, 5.464731e-2,
+              -9.650715e-4, 8.802193e-6, -3.110810e-8)),
+)
+
+
+def _index(table, mv):
+    """Index i so that table[i] <= mv < table[i+1], table must be sorted."""
+    lo = 0
+    hi = len(table) - 1
+    while hi - lo > 1:
+        mid = (lo + hi) >> 1
+        if table[mid] <= mv:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def mv_to_c_its90(mv):
+    """Temperature in C from the NIST type K inverse polynomial, valid
+       from -5.891 mV to 54.886 mV. ValueError if the table in use is of
+       another type."""
+    if TYPE != "K":
+        raise ValueError("no ITS-90 inverse for type " + TYPE)
+    for upper, coefs in _INVERSE:
+        if mv <= upper:
+            break
+    t = 0.0
+    for i in range(len(coefs) - 1, -1, -1):
+        t = t * mv + coefs[i]
+    return t
+
+
+def mv_to_c(mv, full_range=False):
+    """Temperature in C from the table. Out of range values are clamped to
+       the table ends, or use the ITS-90 polynomial if full_range is set
+       (type K only)."""
+    table = TABLE_MV
+    last = len(table) - 1
+    if last < 1:
+        return mv_to_c_its90(mv)
+    if mv <= table[0] or mv >= table[last]:
+        if full_range:
+            return mv_to_c_its90(mv)
+        i = 0 if mv <= table[0] else last
+        return T_MIN + i * T_STEP if TABLE_T is None else TABLE_T[i]
+    i = _index(table, mv)
+    a = table[i]
+    f = (mv - a) / (table[i + 1] - a)
+    if TABLE_T is None:
+        return T_MIN + (i + f) * T_STEP
+    t = TABLE_T[i]
+    return t + f * (TABLE_T[i + 1] - t)
+
+
+_dir = __file__.rsplit("/", 1)[0] + "/" if "/" in __file__ else ""
+try:
+    load(_dir + TABLE_FILE)
+except (OSError, ValueError) as e:
+    print("thermocouple:", repr(e), "using the ITS-90 polynomials")
@@ -0,0 +1,310 @@
+"""
+Binary temperature log on flash.
+
+Records are fixed size structs: elapsed ms since the start of the run,
+raw ADC counts, temperature (0.1 C), setpoint (C) and mode (component id
+of the cycle button). They are packed into a preallocated buffer and
+written in batches by a background task, so logging from the control loop
+never touches flash. A batch still filling is written after 30 s and the
+run is closed when its cycle ends, switching the oven off loses little.
+
+The log is a ring of SEGMENTS files of at most SEGMENT_RECORDS records,
+each starting with a header (magic, version, record size, run, sequence).
+Files are only appended to (littlefs copies blocks on in-place writes,
+appending is the wear-friendly path) and the oldest segment is truncated
+when the ring wraps. Every run starts a new segment.
+
+Logging must never stop the oven: a filesystem error (flash full, littlefs
+error) is counted and disables the logger until the next run.
+
+Export a run over the USB serial with
+
+    mpremote exec "import tlog; tlog.export()" > dump.txt
+
+and decode it on the host with
+
+    python tlog.py dump.txt > run.csv
+
+The export is base64 text: the REPL console is not 8-bit clean (mpremote
+stops at the first 0x04 and drops invalid UTF-8, the board turns 0x0A
+into 0x0D 0x0A). Segment files copied as they are with
+mpremote cp :log/<slot>.bin . decode too.
+"""
+
+import struct
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+RECORD = "<IhhhBx"
+RECORD_SIZE = struct.calcsize(RECORD)
+HEADER = "<4sHHII"
+HEADER_SIZE = struct.calcsize(HEADER)
+MAGIC = b"TKLG"
+VERSION = 1
+FRAME = b"TKSG"
+
+SEGMENTS = 8
+SEGMENT_RECORDS = 5000
+BUFFER_RECORDS = 40
+
+NO_SETPOINT = -32768
+
+
+def _segment(path, slot):
+    return "{}/{}.bin".format(path, slot)
+
+
+def _header(path, slot):
+    try:
+        with open(_segment(path, slot), "rb") as f:
+            h = f.read(HEADER_SIZE)
+    except OSError:
+        return None
+    if len(h) < HEADER_SIZE:
+        return None
+    magic, version, size, run, seq = struct.unpack(HEADER, h)
+    if magic != MAGIC or version != VERSION or size != RECORD_SIZE:
+        return None
+    return run, seq
+
+
+def segments(path="log"):
+    """(seq, run, slot) of the valid segments, oldest first."""
+    found = []
+    for slot in range(SEGMENTS):
+        h = _header(path, slot)
+        if h is not None:
+            found.append((h[1], h[0], slot))
+    found.sort()
+    return found
+
+
+class Logger:
+    def __init__(self, path="log"):
+        self.path = path
+        self.buf = bytearray(BUFFER_RECORDS * RECORD_SIZE)
+        # Buffer waiting to be written by run()
+        self.full = bytearray(BUFFER_RECORDS * RECORD_SIZE)
+        self.full_n = 0
+        self.n = 0
+        self.f = None
+        self.run = 0
+        self.seq = 0
+        self.slot = -1
+        self.seg_records = 0
+        self.records = 0
+        self.dropped = 0
+        self.enabled = False
+        self.errors = 0
+
+    def _fail(self, e):
+        self.errors += 1
+        self.enabled = False
+        self.n = 0
+        self.full_n = 0
+        print("log disabled:", repr(e))
+        if self.f is not None:
+            try:
+                self.f.close()
+            except OSError:
+                pass
+            self.f = None
+
+    def start_run(self):
+        """Close the current run and start a new one in the next segment.
+           Returns False if the log is not available."""
+        try:
+            self.close()
+            try:
+                import os
+                os.mkdir(self.path)
+            except OSError:
+                pass
+            segs = segments(self.path)
+            if segs:
+                seq, run, slot = segs[-1]
+                self.seq = seq
+                self.run = max(s[1] for s in segs) + 1
+                self.slot = slot
+            else:
+                self.seq = 0
+                self.run = 1
+                self.slot = -1
+            self._next_segment()
+        except OSError as e:
+            self._fail(e)
+            return False
+        self.enabled = True
+        return True
+
+    def _next_segment(self):
+        if self.f is not None:
+            self.f.close()
+        self.slot = (self.slot + 1) % SEGMENTS
+        self.seq += 1
+        self.f = open(_segment(self.path, self.slot), "wb")
+        self.f.write(struct.pack(HEADER, MAGIC, VERSION, RECORD_SIZE,
+                                 self.run, self.seq))
+        self.seg_records = 0
+
+    def record(self, ms, raw, temp, setpoint, mode):
+        """Add a record, only touches RAM."""
+        if not self.enabled:
+            return
+        if temp is None:
+            temp = 0
+        struct.pack_into(RECORD, self.buf, self.n * RECORD_SIZE, ms, raw,
+                         int(temp * 10),
+                         NO_SETPOINT if setpoint is None else setpoint, mode)
+        self.n += 1
+        self.records += 1
+        if self.n == BUFFER_RECORDS:
+            if self.full_n:
+                # The writer is behind, overwrite the oldest batch
+                self.dropped += self.full_n
+            self.buf, self.full = self.full, self.buf
+            self.full_n = self.n
+            self.n = 0
+
+    def _write(self, buf, n):
+        i = 0
+        while i < n:
+            if self.seg_records == SEGMENT_RECORDS:
+                self._next_segment()
+            k = min(n - i, SEGMENT_RECORDS - self.seg_records)
+            self.f.write(memoryview(buf)[i * RECORD_SIZE:(i + k) * RECORD_SIZE])
+            self.seg_records += k
+            i += k
+        self.f.flush()
+
+    def flush(self):
+        """Write the pending batch, if any. Returns True if it wrote."""
+        if not self.full_n or self.f is None:
+            return False
+        n = self.full_n
+        self.full_n = 0
+        try:
+            self._write(self.full, n)
+        except OSError as e:
+            self._fail(e)
+            return False
+        return True
+
+    def sync(self):
+        """Write the pending batch and the records of the current one."""
+        self.flush()
+        if not self.n or self.f is None:
+            return
+        try:
+            self._write(self.buf, self.n)
+            self.n = 0
+        except OSError as e:
+            self._fail(e)
+
+    def close(self):
+        if self.f is None:
+            return
+        self.sync()
+        if self.f is None:
+            # The write failed and disabled the log
+            return
+        try:
+            self.f.close()
+        except OSError as e:
+            self._fail(e)
+        self.f = None
+        self.enabled = False
+
+    async def run_writer(self, period_ms=500, max_age_ms=30000):
+        """Background task writing full batches to flash, and the records
+           of a batch still filling once max_age_ms passed since the last
+           write, so a power off loses at most that much of the run."""
+        import uasyncio as asyncio
+        import utime as time
+        last = time.ticks_ms()
+        while True:
+            try:
+                if self.flush():
+                    last = time.ticks_ms()
+                elif self.n and time.ticks_diff(time.ticks_ms(), last) >= max_age_ms:
+                    self.sync()
+                    last = time.ticks_ms()
+            except Exception as e:
+                # flush() already handles filesystem errors, keep the task
+                self._fail(e)
+            await asyncio.sleep_ms(period_ms)
+
+
+def export(path="log", run=None, out=None):
+    """Stream the segments of a run (the last one by default) as frames:
+       b'TKSG', length (u32), segment file, base64 encoded one line per
+       chunk of at most 768 bytes."""
+    if out is None:
+        import sys
+        out = sys.stdout
+    segs = segments(path)
+    if run is None and segs:
+        run = max(s[1] for s in segs)
+    chunk = bytearray(768)
+    for seq, r, slot in segs:
+        if r != run:
+            continue
+        name = _segment(path, slot)
+        with open(name, "rb") as f:
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(0)
+            out.write(binascii.b2a_base64(
+                FRAME + struct.pack("<I", size)).decode())
+            while True:
+                n = f.readinto(chunk)
+                if not n:
+                    break
+                out.write(binascii.b2a_base64(memoryview(chunk)[:n]).decode())
+
+
+def unpack(text):
+    """Frames from export output, lines that are not base64 are skipped."""
+    data = bytearray()
+    for line in text.split():
+        try:
+            data.extend(binascii.a2b_base64(line))
+        except (binascii.Error, ValueError):
+            pass
+    return bytes(data)
+
+
+def _records(seg):
+    magic, version, rsize, run, seq = struct.unpack_from(HEADER, seg)
+    for j in range(HEADER_SIZE, len(seg) - rsize + 1, rsize):
+        ms, raw, temp, sp, mode = struct.unpack_from(RECORD, seg, j)
+        yield (run, ms, raw, temp / 10, None if sp == NO_SETPOINT else sp,
+               mode)
+
+
+def decode(data):
+    """Yield (run, ms, raw, temp C, setpoint C or None, mode) from unpacked
+       export output or from a segment file."""
+    if data[:4] == MAGIC:
+        yield from _records(data)
+        return
+    i = data.find(FRAME)
+    while i >= 0 and i + 8 <= len(data):
+        size = struct.unpack_from("<I", data, i + 4)[0]
+        yield from _records(data[i + 8:i + 8 + size])
+        i = data.find(FRAME, i + 8 + size)
+
+
+if __name__ == "__main__":
+    import sys
+    print("run,ms,raw,temp,setpoint,mode")
+    for name in sys.argv[1:]:
+        with open(name, "rb") as f:
+            data = f.read()
+        if data[:4] != MAGIC and data[:4] != FRAME:
+            data = unpack(data.decode("ascii", "replace"))
+        for r in decode(data):
+            print(",".join("" if v is None else str(v) for v in r))